@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HomePowerMonitor benchmark harness
+
+Runs the plugin outside Domoticz against a simulated HDXXAXXA16GK-D gateway
+(Modbus TCP, registers 0x0008-0x0017) and a stand-in for the Domoticz
+json.htm getdevices API, then reports heartbeat latency, Modbus reads per
+second and memory allocated per heartbeat. With --rtu the modules are
+simulated as Modbus RTU slaves behind a pseudo-terminal pair instead.
+
+Usage:
+    python3 benchmark.py --cycles 500 --modules 3 --latency 40 --jitter 10
+    python3 benchmark.py --options '{"modbus_session": "persistent"}' --max-p99 50
+    python3 benchmark.py --mqtt --heartbeat 0.1
+    python3 benchmark.py --rtu --modules 2
+"""
+
+import os
+import sys
+import json
+import select
+import time
+import random
+import struct
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import socketserver
+import http.server
+
+import fakeDomoticz
+
+CHANNEL_COUNT = 16
+REGISTER_START = 0x0008
+VOLTAGE_IDXS = [1001, 1002, 1003]
+PF_IDXS = [1011, 1012, 1013]
+
+class GatewayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        gateway = self.server
+        while True:
+            header = self._recv_exact(7)
+            if header is None:
+                return
+            transaction_id, _, length, unit_id = struct.unpack('>HHHB', header)
+            pdu = self._recv_exact(length - 1)
+            if pdu is None:
+                return
+
+            response = gateway.respond(unit_id, pdu)
+            if response is None:
+                continue
+            self.request.sendall(struct.pack('>HHHB', transaction_id, 0, len(response) + 1, unit_id) + response)
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            try:
+                chunk = self.request.recv(size - len(data))
+            except OSError:
+                return None
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+class BusSimulator:
+    """HDXXAXXA16GK-D current registers on every unit ID of one RS485 bus."""
+
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.currents = {}
+        self.requests = 0
+        self.dropped = 0
+
+    def respond(self, unit_id, pdu):
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            drop = self.random.random() < self.drop_rate
+            if drop:
+                self.dropped += 1
+            registers = self._next_currents(unit_id)
+
+        # One RS485 bus: requests are answered one at a time
+        with self.lock:
+            time.sleep(delay)
+        if drop:
+            return None
+
+        function_code = pdu[0]
+        if function_code != 3 or len(pdu) != 5:
+            return bytes([function_code | 0x80, 1])
+
+        address, count = struct.unpack('>HH', pdu[1:5])
+        if not (1 <= count <= 125 and REGISTER_START <= address and address + count <= REGISTER_START + CHANNEL_COUNT):
+            return bytes([0x83, 2])
+
+        values = registers[address - REGISTER_START:address - REGISTER_START + count]
+        return bytes([3, count * 2]) + struct.pack(f'>{count}H', *values)
+
+    def _next_currents(self, unit_id):
+        currents = self.currents.setdefault(unit_id, [self.random.randint(0, 1500) for _ in range(CHANNEL_COUNT)])
+        for i, value in enumerate(currents):
+            currents[i] = min(4000, max(0, value + self.random.randint(-25, 25)))
+        return list(currents)
+
+class GatewaySimulator(BusSimulator, socketserver.ThreadingTCPServer):
+    """Modbus TCP gateway in front of the simulated bus."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port, latency=0.0, jitter=0.0, drop_rate=0.0, seed=None):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', port), GatewayHandler)
+        BusSimulator.__init__(self, latency, jitter, drop_rate, seed)
+
+def crc16(data):
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+class RTUSlaveSimulator(BusSimulator):
+    """Modbus RTU slaves on the master side of a pseudo-terminal; the plugin opens the slave side."""
+
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0, seed=None):
+        super().__init__(latency, jitter, drop_rate, seed)
+        self.master, self.slave = os.openpty()
+        self.device = os.ttyname(self.slave)
+        self.running = True
+        self.crc_errors = 0
+
+    def serve_forever(self):
+        buffer = b''
+        while self.running:
+            readable, _, _ = select.select([self.master], [], [], 0.1)
+            if not readable:
+                buffer = b''  # bus silence ends a frame
+                continue
+            buffer += os.read(self.master, 256)
+            while len(buffer) >= 8:
+                frame, buffer = buffer[:8], buffer[8:]
+                if crc16(frame[:6]) != struct.unpack('<H', frame[6:])[0]:
+                    self.crc_errors += 1
+                    buffer = b''
+                    break
+                response = self.respond(frame[0], frame[1:6])
+                if response is not None:
+                    reply = bytes([frame[0]]) + response
+                    os.write(self.master, reply + struct.pack('<H', crc16(reply)))
+
+    def shutdown(self):
+        self.running = False
+
+class DomoticzAPIHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests += 1
+        result = [{'idx': str(idx), 'Name': f"Voltage {idx}", 'Voltage': round(self.server.random.uniform(225, 235), 1)}
+                  for idx in VOLTAGE_IDXS]
+        result += [{'idx': str(idx), 'Name': f"PF {idx}", 'Data': f"{self.server.random.uniform(0.7, 1.0):.2f}"}
+                   for idx in PF_IDXS]
+        body = json.dumps({'status': 'OK', 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class DomoticzAPISimulator(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port):
+        super().__init__(('127.0.0.1', port), DomoticzAPIHandler)
+        self.random = random.Random(1)
+        self.requests = 0
+
+class BrokerHandler(socketserver.BaseRequestHandler):
+    """Just enough MQTT 3.1.1 broker to accept one subscriber and stream domoticz/out updates."""
+
+    def handle(self):
+        broker = self.server
+        try:
+            while True:
+                packet_type, body = self._read_packet()
+                if packet_type == 0x10:
+                    self._send(0x20, b'\x00\x00')
+                elif packet_type == 0x82:
+                    self._send(0x90, body[:2] + b'\x00')
+                    with broker.lock:
+                        broker.subscribers.append(self)
+                elif packet_type == 0xC0:
+                    self._send(0xD0, b'')
+                elif packet_type == 0xE0:
+                    return
+        except (OSError, IndexError):
+            pass
+        finally:
+            with broker.lock:
+                if self in broker.subscribers:
+                    broker.subscribers.remove(self)
+
+    def _read_packet(self):
+        first = self.request.recv(1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self.request.recv(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        body = b''
+        while len(body) < length:
+            chunk = self.request.recv(length - len(body))
+            if not chunk:
+                raise OSError("closed")
+            body += chunk
+        return first, body
+
+    def _send(self, packet_type, body):
+        length, encoded = len(body), bytearray()
+        while True:
+            byte, length = length & 0x7F, length >> 7
+            encoded.append(byte | 0x80 if length else byte)
+            if not length:
+                break
+        self.request.sendall(bytes([packet_type]) + bytes(encoded) + body)
+
+class BrokerSimulator(socketserver.ThreadingTCPServer):
+    """MQTT broker stand-in publishing Domoticz voltage/PF updates every interval seconds."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port, interval=0.5, topic='domoticz/out'):
+        super().__init__(('127.0.0.1', port), BrokerHandler)
+        self.interval = interval
+        self.topic = topic.encode('utf-8')
+        self.random = random.Random(2)
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.published = 0
+        threading.Thread(target=self._publish_loop, daemon=True).start()
+
+    def _publish_loop(self):
+        while True:
+            time.sleep(self.interval)
+            messages = [{'idx': idx, 'dtype': 'General', 'stype': 'Voltage',
+                         'svalue1': f"{self.random.uniform(225, 235):.1f}"} for idx in VOLTAGE_IDXS]
+            messages += [{'idx': idx, 'dtype': 'General', 'stype': 'Custom Sensor',
+                          'svalue1': f"{self.random.uniform(0.7, 1.0):.2f}"} for idx in PF_IDXS]
+            with self.lock:
+                subscribers = list(self.subscribers)
+            for message in messages:
+                body = struct.pack('>H', len(self.topic)) + self.topic + json.dumps(message).encode('utf-8')
+                for subscriber in subscribers:
+                    try:
+                        subscriber._send(0x30, body)
+                        self.published += 1
+                    except OSError:
+                        pass
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def build_parameters(args, modbus_port, http_port, home_folder, serial_port=None):
+    def channels(module):
+        return [{'name': f"M{module + 1} Channel {i + 1}",
+                 'voltage_idx': VOLTAGE_IDXS[i % 3], 'pf_idx': PF_IDXS[i % 3]} for i in range(CHANNEL_COUNT)]
+
+    if args.modules == 1:
+        config = channels(0)
+    else:
+        config = {'modules': [{'name': f"M{m + 1}", 'unit_id': m + 1, 'channels': channels(m)}
+                              for m in range(args.modules)]}
+
+    options = {'domoticz_url': f"http://127.0.0.1:{http_port}"}
+    if args.mqtt:
+        options.update(mqtt_host='127.0.0.1', mqtt_port=args.mqtt_port)
+    if serial_port:
+        options.update(serial_port=serial_port)
+    options.update(json.loads(args.options))
+    return {
+        'Address': '127.0.0.1',
+        'Port': str(modbus_port),
+        'Mode1': json.dumps(config),
+        'Mode2': '1',
+        'Mode3': '1',
+        'Mode4': json.dumps(options),
+        'Mode6': 'Debug' if args.debug else 'Normal',
+        'HomeFolder': home_folder,
+        'HardwareID': 1
+    }
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run(args):
+    fakeDomoticz.VERBOSE = args.debug
+    import plugin
+    plugin.Devices = fakeDomoticz.Devices
+    fakeDomoticz.Devices.clear()
+
+    if args.rtu:
+        gateway = start_server(RTUSlaveSimulator(args.latency / 1000, args.jitter / 1000, args.drop_rate, args.seed))
+    else:
+        gateway = start_server(GatewaySimulator(args.modbus_port, args.latency / 1000, args.jitter / 1000,
+                                                args.drop_rate, args.seed))
+    api = start_server(DomoticzAPISimulator(args.http_port))
+    broker = start_server(BrokerSimulator(args.mqtt_port)) if args.mqtt else None
+    home_folder = tempfile.mkdtemp(prefix='hpm-bench-')
+    plugin.Parameters = build_parameters(args, args.modbus_port, args.http_port, home_folder,
+                                         gateway.device if args.rtu else None)
+
+    hpm = plugin.HPMPlugin()
+    hpm.on_start()
+    if hpm.device_manager is None or hpm.module_poller is None:
+        raise SystemExit("Plugin failed to start, rerun with --debug for details")
+
+    for _ in range(args.warmup):
+        hpm.on_heartbeat()
+        time.sleep(args.heartbeat)
+
+    gateway.requests = gateway.dropped = 0
+    api.requests = 0
+    timings = []
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        cycle_start = time.perf_counter()
+        hpm.on_heartbeat()
+        timings.append(time.perf_counter() - cycle_start)
+        time.sleep(args.heartbeat)
+    elapsed = time.perf_counter() - started
+    modbus_requests, http_requests, dropped = gateway.requests, api.requests, gateway.dropped
+
+    # Separate pass so tracing overhead does not distort the timings above
+    tracemalloc.start()
+    peaks = []
+    for _ in range(args.alloc_cycles):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        hpm.on_heartbeat()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        time.sleep(args.heartbeat)
+    tracemalloc.stop()
+
+    hpm.on_stop()
+    gateway.shutdown()
+    api.shutdown()
+    if broker:
+        broker.shutdown()
+
+    return {
+        'cycles': args.cycles,
+        'modules': args.modules,
+        'channels': args.modules * CHANNEL_COUNT,
+        'heartbeat_p50_ms': percentile(timings, 0.50) * 1000,
+        'heartbeat_p99_ms': percentile(timings, 0.99) * 1000,
+        'heartbeat_max_ms': max(timings) * 1000,
+        'modbus_reads_per_s': modbus_requests / elapsed,
+        'modbus_dropped': dropped,
+        'http_requests': http_requests,
+        'alloc_kib_per_cycle': sum(peaks) / len(peaks) / 1024 if peaks else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HPM plugin against simulated hardware")
+    parser.add_argument('--cycles', type=int, default=200, help="measured heartbeats")
+    parser.add_argument('--warmup', type=int, default=5, help="heartbeats before measuring")
+    parser.add_argument('--alloc-cycles', type=int, default=20, help="heartbeats traced for allocations")
+    parser.add_argument('--heartbeat', type=float, default=0.0, help="seconds between heartbeats")
+    parser.add_argument('--modules', type=int, default=1, help="number of simulated modules")
+    parser.add_argument('--latency', type=float, default=0.0, help="gateway response latency in ms")
+    parser.add_argument('--jitter', type=float, default=0.0, help="gateway latency jitter in ms")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="fraction of Modbus frames left unanswered")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--options', default='{}', help="plugin Advanced Options JSON")
+    parser.add_argument('--modbus-port', type=int, default=15502)
+    parser.add_argument('--http-port', type=int, default=18080)
+    parser.add_argument('--mqtt', action='store_true', help="push voltage/PF through a simulated MQTT broker")
+    parser.add_argument('--mqtt-port', type=int, default=11883)
+    parser.add_argument('--rtu', action='store_true', help="poll simulated Modbus RTU slaves over a pseudo-terminal")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    parser.add_argument('--max-p99', type=float, help="exit with status 1 if heartbeat p99 exceeds this many ms")
+    parser.add_argument('--debug', action='store_true', help="show plugin log output")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{results['cycles']} heartbeats, {results['modules']} module(s), {results['channels']} channels")
+        print(f"  heartbeat p50 {results['heartbeat_p50_ms']:.2f}ms, p99 {results['heartbeat_p99_ms']:.2f}ms, "
+              f"max {results['heartbeat_max_ms']:.2f}ms")
+        print(f"  Modbus {results['modbus_reads_per_s']:.1f} reads/s ({results['modbus_dropped']} dropped), "
+              f"{results['http_requests']} HTTP requests")
+        print(f"  {results['alloc_kib_per_cycle']:.1f} KiB allocated per heartbeat (peak)")
+
+    if args.max_p99 is not None and results['heartbeat_p99_ms'] > args.max_p99:
+        print(f"FAIL: heartbeat p99 {results['heartbeat_p99_ms']:.2f}ms exceeds {args.max_p99}ms", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
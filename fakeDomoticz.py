@@ -1,19 +1,37 @@
 # fakeDomoticz.py
-class Domoticz:
-    @staticmethod
-    def Error(msg): print(f"ERROR: {msg}")
-    @staticmethod
-    def Log(msg): print(f"LOG: {msg}")
-    @staticmethod
-    def Debug(msg): print(f"DEBUG: {msg}")
-    @staticmethod
-    def Debugging(level): pass
-    class Device:
-        def __init__(self, Name, Unit, TypeName, Type, Subtype, Options, Used):
-            self.Name = Name
-            self.Unit = Unit
-        def Create(self): print(f"Created device: {self.Name}")
-        def Update(self, nValue, sValue): print(f"Updated device {self.Name}: {sValue}")
+# Stand-in for the Domoticz plugin API when running outside Domoticz.
+# Set VERBOSE = False to silence device creation/update output (e.g. in benchmarks).
+VERBOSE = True
+
+def Error(msg): print(f"ERROR: {msg}")
+def Log(msg):
+    if VERBOSE: print(f"LOG: {msg}")
+def Debug(msg):
+    if VERBOSE: print(f"DEBUG: {msg}")
+def Debugging(level): pass
+def Heartbeat(seconds): pass
+
+class Device:
+    def __init__(self, Name, Unit, TypeName, Type=0, Subtype=0, Options=None, Used=0, DeviceID="", **kwargs):
+        self.Name = Name
+        self.Unit = Unit
+        self.Type = Type
+        self.SubType = Subtype
+        self.Options = Options or {}
+        self.DeviceID = DeviceID
+        self.ID = Unit
+        self.nValue = 0
+        self.sValue = ""
+    def Create(self):
+        Devices[self.Unit] = self
+        if VERBOSE: print(f"Created device: {self.Name}")
+    def Update(self, nValue, sValue, **kwargs):
+        self.nValue = nValue
+        self.sValue = sValue
+        if VERBOSE: print(f"Updated device {self.Name}: {sValue}")
+    def Delete(self):
+        Devices.pop(self.Unit, None)
+
 Devices = {}
 Parameters = {
     "Address": "10.0.20.27",
@@ -21,5 +39,8 @@ Parameters = {
     "Mode2": "14",
     "Mode3": "1",
     "Mode1": '[{"name": "Test", "voltage": 230, "pf": 0.75}]',
-    "Mode6": "Debug"
+    "Mode4": "{}",
+    "Mode6": "Debug",
+    "HomeFolder": "",
+    "HardwareID": 1
 }
@@ -4,7 +4,7 @@
 HomePowerMonitor Plugin for Domoticz
 Author: voyo@no-ip.pl
 Version: 0.0.3
-Description: Monitors current (A) and calculates power (W) for 16 channels using Modbus TCP
+Description: Monitors current (A) and calculates power (W) for 16 channels per module using Modbus TCP
 Requirements: pyModbusTCP (pip3 install pyModbusTCP)
 License: Apache License 2.0
 """
@@ -15,6 +15,7 @@ License: Apache License 2.0
         Monitors current (A) and calculates power (W) for 16 channels using Modbus TCP
         with HDXXAXXA16GK-D device from Guangzhou Huidian.
         Creates additional summary devices for phase currents and powers based on voltage_idx groups.
+        Several modules on the same RS485 bus can be polled by one hardware instance.
         <br/><br/>
         <b>Requirements:</b> pip3 install pyModbusTCP
     </description>
@@ -23,6 +24,7 @@ License: Apache License 2.0
         <param field="Port" label="Port" width="50px" required="true" default="8887"/>
         <param field="Mode2" label="Modbus ID" width="50px" required="true" default="14"/>
         <param field="Mode3" label="Reading Interval (x10s)" width="50px" required="true" default="1"/>
+        <param field="Mode4" label="Advanced Options (JSON)" width="600px" required="false" default="{}"/>
 
         <param field="Mode1" label="Channel Configuration (JSON)" width="600px" required="true" default='[
             {"name": "Pralka", "voltage_idx": 1317, "pf_idx": 1317},
@@ -53,29 +55,186 @@ License: Apache License 2.0
 </plugin>
 """
 
+import os
 import time
 import json
-import urllib.request
-import urllib.error
+import mmap
+import base64
+import random
+import struct
+import hashlib
+import sqlite3
+import socket
+import select
+import threading
+import collections
+import concurrent.futures
+import http.client
+import http.server
+import urllib.parse
+from array import array
+from contextlib import contextmanager
 
 try:
     import Domoticz
 except ImportError:
     import fakeDomoticz as Domoticz
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 try:
     from pyModbusTCP.client import ModbusClient
+    from pyModbusTCP.constants import (MB_SEND_ERR, MB_RECV_ERR, MB_SOCK_CLOSE_ERR, MB_TIMEOUT_ERR, EXP_DATA_ADDRESS,
+                                       EXP_ILLEGAL_FUNCTION, EXP_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND)
 except ImportError:
     ModbusClient = None
+    # Same values as pyModbusTCP.constants
+    MB_SEND_ERR, MB_RECV_ERR, MB_TIMEOUT_ERR, MB_SOCK_CLOSE_ERR = 3, 4, 5, 9
+    EXP_ILLEGAL_FUNCTION, EXP_DATA_ADDRESS, EXP_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND = 1, 2, 11
+
+try:
+    # Only the fan-out server needs it, and older pyModbusTCP releases lack DataHandler
+    from pyModbusTCP.server import ModbusServer, DataHandler
+except ImportError:
+    ModbusServer = DataHandler = None
+
+try:
+    import termios
+except ImportError:
+    termios = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Constants
 CHANNEL_COUNT = 16
+MAX_MODULES = 6
+MODULE_UNIT_SPAN = CHANNEL_COUNT * 2
+SUMMARY_UNIT_START = MAX_MODULES * MODULE_UNIT_SPAN + 1
 CURRENT_REGISTER_START = 8
 CURRENT_MULTIPLIER = 0.01
+MODBUS_MAX_REGISTERS = 125
+REGISTER_MAX_GAP = 8
+# Register map value types: (registers, signed)
+REGISTER_TYPES = {'u16': (1, False), 's16': (1, True), 'u32': (2, False), 's32': (2, True), 'f32': (2, True)}
 MAX_CURRENT = 40
 MAX_POWER = 10000
 MAX_CONSECUTIVE_FAILURES = 5
 CONNECTION_RESET_COOLDOWN = 30
+BACKOFF_BASE = 1
+BACKOFF_MAX = 300
+HTTP_TIMEOUT = 3
+BREAKER_FAILURES = 3
+MQTT_KEEPALIVE = 60
+LOG_QUEUE_SIZE = 1000
+LOG_RATE_INTERVAL = 300
+HEARTBEAT_SECONDS = 10
+MODBUS_TIMEOUT = 2
+RTU_BAUDRATES = (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200)
+SESSION_PROBE_IDLE = 5
+LATENCY_WINDOW = 100
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+EVENT_UNIT_START = 200
+EVENT_UNIT_END = 252
+EVENT_DEFAULTS = {'on': 0.5, 'off': 0.2, 'min_duration': 3}
+EVENT_QUEUE_SIZE = 1000
+AGGREGATION_RESYNC = 1000
+# Below this many channels NumPy's per-call overhead outweighs its vectorized arithmetic
+NUMPY_MIN_CHANNELS = 96
+DIAGNOSTIC_UNITS = {'heartbeat_ms': 255, 'modbus_read_ms': 254, 'modbus_failures': 253}
+HISTORY_FLUSH_INTERVAL = 10
+HISTORY_ROLLUP_INTERVAL = 60
+HISTORY_MAX_PENDING = 100000
+
+# Energy checkpoint file: header + fixed table of (key, Wh, last W, last time) records
+ENERGY_FILE_MAGIC = b'HPME'
+ENERGY_FILE_VERSION = 1
+ENERGY_SLOTS = 256
+ENERGY_HEADER = struct.Struct('<4sII')
+ENERGY_RECORD = struct.Struct('<I4xddd')
+ENERGY_PHASE_KEY = 0x80000000
+ENERGY_TOTAL_KEY = 0xFFFFFFFF
+ENERGY_MAX_GAP = 300
+ENERGY_FLUSH_INTERVAL = 60
+# Shared value file: header + fixed table of (IDX, value, fetched at, refresh claimed until) records
+SHARED_FILE_MAGIC = b'HPMV'
+SHARED_FILE_VERSION = 1
+SHARED_SLOTS = 256
+SHARED_HEADER = struct.Struct('<4sII')
+SHARED_RECORD = struct.Struct('<I4xddd')
+SHARED_CLAIM_SECONDS = HTTP_TIMEOUT * 2
+# Warm start snapshot
+STATE_FILE_VERSION = 1
+STATE_SAVE_INTERVAL = 300
+STATE_MAX_AGE = 900
+# Capture file: header + channel config JSON + fixed-width records (see CaptureWriter)
+CAPTURE_FILE_MAGIC = b'HPMC'
+CAPTURE_FILE_VERSION = 1
+CAPTURE_HEADER = struct.Struct('<4sIIII')
+CAPTURE_CHANNEL_KEYS = ('name', 'voltage', 'pf', 'voltage_idx', 'pf_idx', 'current_unit', 'power_unit')
+CAPTURE_FLUSH_INTERVAL = 10
+
+# Advanced options (Mode4 JSON) and their defaults
+DEFAULT_OPTIONS = {
+    'domoticz_url': 'http://127.0.0.1:8080',
+    'value_ttl': 30,
+    'value_ttl_per_idx': {},
+    'value_max_age': 300,
+    'shared_cache_file': None,
+    'value_fetch': 'bulk',
+    'fetch_workers': 4,
+    'fetch_deadline': HTTP_TIMEOUT,
+    'breaker_cooloff': 30,
+    'acquisition': 'inline',
+    'poll_interval': None,
+    'buffer_size': 64,
+    'modbus_session': 'per_read',
+    'module_polling': 'sequential',
+    'bus_budget': 1.0,
+    'deadband': {},
+    'publish_refresh': 300,
+    'sample_aggregation': None,
+    'energy': False,
+    'energy_file': None,
+    'warm_start': False,
+    'state_file': None,
+    'compute_engine': 'auto',
+    'heartbeat_budget': HEARTBEAT_SECONDS,
+    'metrics_port': None,
+    'metrics_bind': '127.0.0.1',
+    'diagnostic_devices': False,
+    'history_file': None,
+    'history_batch': 500,
+    'history_retention_days': {'raw': 2, 'minute': 30, 'hour': 730},
+    'capture_file': None,
+    'capture_max_mb': 1024,
+    'adaptive_polling': False,
+    'poll_min_interval': None,
+    'poll_max_interval': None,
+    'change_threshold': 0.5,
+    'backoff_base': BACKOFF_BASE,
+    'backoff_max': BACKOFF_MAX,
+    'mqtt_host': None,
+    'mqtt_port': 1883,
+    'mqtt_topic': 'domoticz/out',
+    'mqtt_username': None,
+    'mqtt_password': None,
+    'registers': [],
+    'groups': [],
+    'register_gap': REGISTER_MAX_GAP,
+    'fanout_port': None,
+    'fanout_bind': '127.0.0.1',
+    'fanout_max_age': None,
+    'serial_port': None,
+    'serial_baudrate': 9600,
+    'serial_parity': 'N',
+    'serial_stopbits': 1,
+}
 
 # Device type definitions
 DEVICE_TYPES = {
@@ -90,31 +249,245 @@ DEVICE_TYPES = {
         'type_id': 248,
         'sub_type': 1,
         'options': {'EnergyMeterMode': '1'}
+    },
+    'energy': {
+        'type_name': 'kWh',
+        'type_id': 243,
+        'sub_type': 29,
+        'options': {'EnergyMeterMode': '0'}
+    },
+    'switch': {
+        'type_name': 'Switch',
+        'type_id': 244,
+        'sub_type': 73,
+        'options': {}
+    },
+    'duration': {
+        'type_name': 'Custom',
+        'type_id': 0,
+        'sub_type': 0,
+        'options': {'Custom': '1;ms'}
+    },
+    'count': {
+        'type_name': 'Custom',
+        'type_id': 0,
+        'sub_type': 0,
+        'options': {'Custom': '1;errors'}
     }
 }
 
 class Logger:
-    def __init__(self):
+    """Plugin log with deferred formatting and rate-limited warnings and errors."""
+
+    def __init__(self, rate_interval=LOG_RATE_INTERVAL):
         self.debug_mode = False
+        # Domoticz API calls are only safe from the plugin thread; messages
+        # logged by worker threads are queued and emitted by flush()
+        self.owner_thread = threading.get_ident()
+        self.pending = collections.deque(maxlen=LOG_QUEUE_SIZE)
+        self.rate_interval = rate_interval
+        self.rate_state = {}
+        self.lock = threading.Lock()
 
     def set_debug_mode(self, enabled):
         self.debug_mode = enabled
 
-    def info(self, message):
-        Domoticz.Log(f"HPM: {message}")
+    def info(self, message, *args):
+        self._emit(Domoticz.Log, "HPM: ", message, args)
 
-    def error(self, message):
-        Domoticz.Error(f"HPM: {message}")
+    def error(self, message, *args, key=None):
+        self._emit_limited(Domoticz.Error, "HPM: ", message, args, key)
 
-    def debug(self, message):
+    def debug(self, message, *args):
         if self.debug_mode:
-            Domoticz.Debug(f"HPM: {message}")
+            self._emit(Domoticz.Debug, "HPM: ", message, args)
+
+    def warning(self, message, *args, key=None):
+        self._emit_limited(Domoticz.Log, "HPM: WARNING: ", message, args, key)
+
+    def _emit_limited(self, func, prefix, message, args, key):
+        now = time.monotonic()
+        if key is None:
+            # Same template with different arguments is a different problem, not a repeat
+            key = (message, repr(args))
+        with self.lock:
+            state = self.rate_state.get(key)
+            if state is not None and now - state[0] < self.rate_interval:
+                state[1] += 1
+                state[2] = (func, prefix, message, args)
+                return
+            suppressed = state[1] if state else 0
+            self.rate_state[key] = [now, 0, None]
+        self._emit(func, prefix, message, args, suppressed)
 
-    def warning(self, message):
-        Domoticz.Log(f"HPM: WARNING: {message}")
+    def _emit(self, func, prefix, message, args, suppressed=0):
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args!r}"
+        if suppressed:
+            message = f"{message} (suppressed {suppressed} times)"
+        if threading.get_ident() == self.owner_thread:
+            func(prefix + message)
+        else:
+            self.pending.append((func, prefix + message))
+
+    def flush(self):
+        while self.pending:
+            func, message = self.pending.popleft()
+            func(message)
+
+    def flush_suppressed(self):
+        """Emit the last suppressed occurrence of every rate-limited message."""
+        with self.lock:
+            held = [state for state in self.rate_state.values() if state[1]]
+            self.rate_state.clear()
+        for _, suppressed, (func, prefix, message, args) in held:
+            self._emit(func, prefix, message, args, suppressed)
 
 logger = Logger()
 
+class Histogram:
+    """Cumulative Prometheus-style buckets plus a rolling window for quantiles."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS, window=LATENCY_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.window = collections.deque(maxlen=window)
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+        self.window.append(value)
+
+    def quantile(self, fraction):
+        if not self.window:
+            return 0.0
+        ordered = sorted(self.window)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def get(self, name, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            return self.counters.get(key, self.gauges.get(key, 0))
+
+    def quantile(self, name, fraction, **labels):
+        with self.lock:
+            histogram = self.histograms.get(self._key(name, labels))
+            return histogram.quantile(fraction) if histogram else 0.0
+
+    @staticmethod
+    def _escape(value):
+        # Label values can come from the user's config (register names)
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def render(self):
+        def labels_text(labels, extra=()):
+            pairs = [f'{k}="{Metrics._escape(v)}"' for k, v in labels + tuple(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        lines = []
+        with self.lock:
+            for kind, series in (('counter', self.counters), ('gauge', self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(series.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{name}{labels_text(labels)} {value}")
+
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{labels_text(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{labels_text(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{labels_text(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer:
+    """Optional local HTTP endpoint serving the metrics in Prometheus text format."""
+
+    def __init__(self, bind, port):
+        self.server = http.server.ThreadingHTTPServer((bind, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="HPM-Metrics", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(1)
+
 class ValidationError(Exception):
     pass
 
@@ -122,8 +495,28 @@ class ConfigValidator:
     @staticmethod
     def validate_config(params):
         connection_params = ConfigValidator._validate_connection_params(params)
-        channels = ConfigValidator._parse_channel_config(params.get("Mode1", ""))
-        return connection_params, channels
+        modules, channels = ConfigValidator._parse_module_config(params.get("Mode1", ""), connection_params)
+        options = ConfigValidator._parse_options(params.get("Mode4", ""))
+        options['registers'] = ConfigValidator._parse_register_map(options['registers'], connection_params, modules)
+        options['groups'] = ConfigValidator._parse_groups(options['groups'], modules, channels)
+        if options['fanout_port'] is not None:
+            # The fan-out server answers by Modbus ID alone, so one ID cannot live on two gateways
+            gateways = {}
+            for device in modules + options['registers']:
+                gateway = gateways.setdefault(device['unit_id'], (device['host'], device['port']))
+                if gateway != (device['host'], device['port']):
+                    raise ValidationError(f"fanout_port needs Modbus IDs that are unique across gateways, but ID "
+                                          f"{device['unit_id']} is used on both {gateway[0]}:{gateway[1]} and "
+                                          f"{device['host']}:{device['port']}")
+        if options['serial_port']:
+            # One serial bus: every module and register is read through the local adapter
+            if any((device['host'], device['port']) != (connection_params['host'], connection_params['port'])
+                   for device in modules + options['registers']):
+                raise ValidationError("host/port of modules and registers cannot be used with serial_port")
+            connection_params.update(transport='rtu', serial_port=options['serial_port'],
+                                     baudrate=options['serial_baudrate'], parity=options['serial_parity'],
+                                     stopbits=options['serial_stopbits'])
+        return connection_params, modules, channels, options
 
     @staticmethod
     def _validate_connection_params(params):
@@ -147,45 +540,535 @@ class ConfigValidator:
             raise ValidationError(f"Invalid numeric parameter: {e}")
 
     @staticmethod
-    def _parse_channel_config(config_json):
+    def _parse_module_config(config_json, connection_params):
         try:
             config = json.loads(config_json)
         except json.JSONDecodeError as e:
             raise ValidationError(f"Invalid JSON format: {e}")
 
+        # A plain channel list is the single-module configuration using Mode2 as Modbus ID
+        if isinstance(config, list):
+            module_configs = [{'unit_id': connection_params['unit_id'], 'channels': config}]
+            multi_module = False
+        elif isinstance(config, dict) and isinstance(config.get('modules'), list) and config['modules']:
+            module_configs = config['modules']
+            multi_module = True
+        else:
+            raise ValidationError("Configuration must be a list of channels or an object with a 'modules' list")
+
+        if len(module_configs) > MAX_MODULES:
+            raise ValidationError(f"At most {MAX_MODULES} modules are supported")
+
+        modules = []
+        channels = []
+        used_slots = set()
+        used_addresses = set()
+        for m, module in enumerate(module_configs):
+            if not isinstance(module, dict):
+                raise ValidationError(f"Module {m+1} must be a dictionary")
+
+            name = str(module.get('name', f"Module {m+1}")).strip()
+            try:
+                slot = int(module.get('slot', m))
+                unit_id = int(module.get('unit_id', 0))
+                host = str(module.get('host', connection_params['host'])).strip()
+                port = int(module.get('port', connection_params['port']))
+            except (TypeError, ValueError) as e:
+                raise ValidationError(f"Module {m+1}: invalid numeric parameter: {e}")
+
+            if not 0 <= slot < MAX_MODULES:
+                raise ValidationError(f"Module {m+1} slot must be between 0 and {MAX_MODULES - 1}")
+            if slot in used_slots:
+                raise ValidationError(f"Module {m+1} slot {slot} is already used")
+            if not 1 <= unit_id <= 247:
+                raise ValidationError(f"Module {m+1} Modbus ID must be between 1 and 247")
+            if not 1 <= port <= 65535:
+                raise ValidationError(f"Module {m+1} port must be between 1 and 65535")
+            if (host, port, unit_id) in used_addresses:
+                raise ValidationError(f"Module {m+1} duplicates Modbus ID {unit_id} on {host}:{port}")
+            used_slots.add(slot)
+            used_addresses.add((host, port, unit_id))
+
+            label = f"{name} " if multi_module else ""
+            module_channels = ConfigValidator._parse_channel_config(module.get('channels'), label)
+            unit_base = slot * MODULE_UNIT_SPAN
+            for c, channel in enumerate(module_channels):
+                channel['module'] = m
+                channel['current_unit'] = unit_base + c + 1
+                channel['power_unit'] = unit_base + CHANNEL_COUNT + c + 1
+                if channel['switch']:
+                    # Derived from the slot and channel position, so switching another channel never moves it
+                    channel['switch_unit'] = channel['switch'].pop('unit', None) or \
+                        EVENT_UNIT_START + slot * CHANNEL_COUNT + c
+                    if channel['switch_unit'] > EVENT_UNIT_END:
+                        raise ValidationError(f"{label}Channel {c+1} switch needs an explicit 'unit' (its default, "
+                                              f"{channel['switch_unit']}, is above {EVENT_UNIT_END})")
+
+            modules.append({
+                'name': name,
+                'slot': slot,
+                'unit_id': unit_id,
+                'host': host,
+                'port': port,
+                'first_channel': len(channels)
+            })
+            channels.extend(module_channels)
+
+        ConfigValidator._check_unit_layout(modules, channels)
+        return modules, channels
+
+    @staticmethod
+    def _check_unit_layout(modules, channels):
+        """Reject layouts where two devices would share a unit, e.g. a 4th phase's sums on the first switch units."""
+        owners = {}
+
+        def claim(unit, owner):
+            if not 1 <= unit <= 255:
+                raise ValidationError(f"{owner} would need device unit {unit}, outside 1-255")
+            if unit in owners:
+                raise ValidationError(f"Device unit {unit} would be used by both {owners[unit]} and {owner}")
+            owners[unit] = owner
+
+        for unit in DIAGNOSTIC_UNITS.values():
+            claim(unit, "the diagnostic devices")
+        for channel in channels:
+            claim(channel['current_unit'], f"'{channel['name']}' current")
+            claim(channel['power_unit'], f"'{channel['name']}' power")
+            if channel.get('switch_unit'):
+                claim(channel['switch_unit'], f"'{channel['name']}' switch")
+        phases = len({c['voltage_idx'] for c in channels if c.get('voltage_idx') is not None})
+        summary_start = ConfigValidator.summary_unit_start(modules)
+        for unit in range(summary_start, summary_start + phases * 2 + 1):
+            claim(unit, f"the phase summaries ({phases} phases)")
+
+    @staticmethod
+    def _parse_channel_config(config, label=""):
         if not isinstance(config, list):
-            raise ValidationError("Configuration must be a list")
+            raise ValidationError(f"{label}Configuration must be a list")
 
         if len(config) != CHANNEL_COUNT:
-            raise ValidationError(f"Configuration must contain exactly {CHANNEL_COUNT} channels")
+            raise ValidationError(f"{label}Configuration must contain exactly {CHANNEL_COUNT} channels")
 
         channels = []
         for i, channel in enumerate(config):
             if not isinstance(channel, dict):
-                raise ValidationError(f"Channel {i+1} must be a dictionary")
+                raise ValidationError(f"{label}Channel {i+1} must be a dictionary")
 
-            name = channel.get('name', f"Channel {i+1}").strip()
+            name = channel.get('name', f"{label}Channel {i+1}").strip()
             voltage = channel.get('voltage', 230)
             voltage_idx = channel.get('voltage_idx')
             pf = channel.get('pf', 0.75)
             pf_idx = channel.get('pf_idx')
 
             if voltage_idx is None and (not isinstance(voltage, (int, float)) or voltage <= 0):
-                raise ValidationError(f"Channel {i+1} voltage must be positive")
+                raise ValidationError(f"{label}Channel {i+1} voltage must be positive")
 
             if pf_idx is None and (not isinstance(pf, (int, float)) or not (0 < pf <= 1)):
-                raise ValidationError(f"Channel {i+1} power factor must be between 0 and 1")
+                raise ValidationError(f"{label}Channel {i+1} power factor must be between 0 and 1")
+
+            voltage_idx = ConfigValidator._parse_idx(voltage_idx, f"{label}Channel {i+1} voltage_idx")
+            pf_idx = ConfigValidator._parse_idx(pf_idx, f"{label}Channel {i+1} pf_idx")
 
             channels.append({
                 'name': name,
                 'voltage': voltage,
                 'voltage_idx': voltage_idx,
                 'pf': pf,
-                'pf_idx': pf_idx
+                'pf_idx': pf_idx,
+                'switch': ConfigValidator._parse_switch(channel.get('switch', False), f"{label}Channel {i+1}")
             })
 
         return channels
 
+    @staticmethod
+    def _parse_switch(switch, label):
+        """On/off detection settings of a channel: false, true (defaults) or an object overriding them."""
+        if switch is False or switch is None:
+            return None
+        if switch is True:
+            return dict(EVENT_DEFAULTS)
+        if not isinstance(switch, dict):
+            raise ValidationError(f"{label} switch must be true, false or an object")
+        unknown = sorted(set(switch) - set(EVENT_DEFAULTS) - {'unit'})
+        if unknown:
+            raise ValidationError(f"{label} switch: unknown key(s): {', '.join(unknown)}")
+
+        settings = dict(EVENT_DEFAULTS, **switch)
+        unit = settings.pop('unit', None)
+        if unit is not None and (isinstance(unit, bool) or not isinstance(unit, int) or not 1 <= unit <= 252):
+            raise ValidationError(f"{label} switch unit must be a device unit between 1 and 252")
+        for key, value in settings.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValidationError(f"{label} switch {key} must be a non-negative number")
+        if settings['off'] >= settings['on']:
+            raise ValidationError(f"{label} switch 'off' threshold must be below 'on'")
+        settings['unit'] = unit
+        return settings
+
+    @staticmethod
+    def _parse_register_map(registers, connection_params, modules):
+        """Validate the extra registers to read alongside the channel currents."""
+        if not isinstance(registers, list):
+            raise ValidationError("registers must be a list of register definitions")
+
+        allowed = {'name', 'unit_id', 'address', 'type', 'scale', 'word_order', 'function', 'idx', 'host', 'port'}
+        module_blocks = {(m['host'], m['port'], m['unit_id']) for m in modules}
+        parsed = []
+        names = set()
+        for r, register in enumerate(registers):
+            if not isinstance(register, dict):
+                raise ValidationError(f"Register {r+1} must be a dictionary")
+            unknown = sorted(set(register) - allowed)
+            if unknown:
+                raise ValidationError(f"Register {r+1}: unknown key(s): {', '.join(unknown)}")
+
+            name = register.get('name')
+            if not isinstance(name, str) or not name.strip():
+                raise ValidationError(f"Register {r+1} must have a name")
+            name = name.strip()
+            if name in names:
+                raise ValidationError(f"Register name '{name}' is used more than once")
+            names.add(name)
+
+            try:
+                unit_id = int(register.get('unit_id', connection_params['unit_id']))
+                address = int(register['address'])
+                port = int(register.get('port', connection_params['port']))
+            except KeyError:
+                raise ValidationError(f"Register '{name}' must have an address")
+            except (TypeError, ValueError) as e:
+                raise ValidationError(f"Register '{name}': invalid numeric parameter: {e}")
+
+            value_type = register.get('type', 'u16')
+            if value_type not in REGISTER_TYPES:
+                raise ValidationError(f"Register '{name}' type must be one of {', '.join(REGISTER_TYPES)}")
+            width = REGISTER_TYPES[value_type][0]
+            if not 1 <= unit_id <= 247:
+                raise ValidationError(f"Register '{name}' Modbus ID must be between 1 and 247")
+            if not 0 <= address <= 0x10000 - width:
+                raise ValidationError(f"Register '{name}' address must be between 0 and {0x10000 - width}")
+            if not 1 <= port <= 65535:
+                raise ValidationError(f"Register '{name}' port must be between 1 and 65535")
+            scale = register.get('scale', 1)
+            if isinstance(scale, bool) or not isinstance(scale, (int, float)):
+                raise ValidationError(f"Register '{name}' scale must be a number")
+            word_order = register.get('word_order', 'big')
+            if word_order not in ('big', 'little'):
+                raise ValidationError(f"Register '{name}' word_order must be 'big' or 'little'")
+            function = register.get('function', 'holding')
+            if function not in ('holding', 'input'):
+                raise ValidationError(f"Register '{name}' function must be 'holding' or 'input'")
+
+            host = str(register.get('host', connection_params['host'])).strip()
+            if function == 'holding' and (host, port, unit_id) in module_blocks and \
+                    address < CURRENT_REGISTER_START + CHANNEL_COUNT and address + width > CURRENT_REGISTER_START:
+                raise ValidationError(f"Register '{name}' overlaps the channel current registers")
+
+            parsed.append({
+                'name': name,
+                'unit_id': unit_id,
+                'address': address,
+                'type': value_type,
+                'width': width,
+                'scale': scale,
+                'word_order': word_order,
+                'function': function,
+                'idx': ConfigValidator._parse_idx(register.get('idx'), f"Register '{name}' idx"),
+                'host': host,
+                'port': port
+            })
+        return parsed
+
+    @staticmethod
+    def summary_unit_start(modules):
+        # Single-module installs keep the original unit numbers for summary devices
+        legacy_layout = len(modules) == 1 and modules[0]['slot'] == 0
+        return CHANNEL_COUNT * 2 + 1 if legacy_layout else SUMMARY_UNIT_START
+
+    @staticmethod
+    def check_legacy_summaries(modules, channels, devices):
+        """Refuse to let channels take over summary devices left by a single-module setup."""
+        legacy_start = CHANNEL_COUNT * 2 + 1
+        if ConfigValidator.summary_unit_start(modules) == legacy_start:
+            return
+        owners = {}
+        for channel in channels:
+            owners[channel['current_unit']] = owners[channel['power_unit']] = channel['name']
+        for unit in range(legacy_start, legacy_start + MODULE_UNIT_SPAN):
+            name = devices[unit].Name if unit in devices else ''
+            if not any(marker in name for marker in ('Current Sum', 'Power Sum')):
+                continue
+            if unit in owners:
+                raise ValidationError(f"Device unit {unit} still holds the summary device '{name}' of the "
+                                      f"single-module layout and would be reused by channel {owners[unit]}; "
+                                      f"delete it in Domoticz (summaries now start at {SUMMARY_UNIT_START})")
+            logger.warning("Device unit %d ('%s') is a summary device of the single-module layout and is no longer "
+                           "updated; summaries now start at %d", unit, name, SUMMARY_UNIT_START,
+                           key=('legacy_summary', unit))
+
+    @staticmethod
+    def _parse_groups(groups, modules, channels):
+        """Validate the aggregation groups and their device units."""
+        if not isinstance(groups, list):
+            raise ValidationError("groups must be a list of group definitions")
+
+        channel_index = {}
+        for i, channel in enumerate(channels):
+            channel_index.setdefault(channel['name'], []).append(i)
+
+        names = {}
+        for g, group in enumerate(groups):
+            if not isinstance(group, dict):
+                raise ValidationError(f"Group {g+1} must be a dictionary")
+            unknown = sorted(set(group) - {'name', 'channels', 'groups', 'unit'})
+            if unknown:
+                raise ValidationError(f"Group {g+1}: unknown key(s): {', '.join(unknown)}")
+            name = group.get('name')
+            if not isinstance(name, str) or not name.strip():
+                raise ValidationError(f"Group {g+1} must have a name")
+            if name.strip() in names:
+                raise ValidationError(f"Group name '{name.strip()}' is used more than once")
+            names[name.strip()] = g
+
+        parsed = []
+        for group in groups:
+            name = group['name'].strip()
+            members = {}
+            for key, index in (('channels', channel_index), ('groups', names)):
+                references = group.get(key, [])
+                if not isinstance(references, list) or not all(isinstance(ref, str) for ref in references):
+                    raise ValidationError(f"Group '{name}': {key} must be a list of names")
+                members[key] = []
+                for ref in references:
+                    if ref not in index:
+                        raise ValidationError(f"Group '{name}': unknown {key[:-1]} '{ref}'")
+                    if key == 'channels':
+                        if len(index[ref]) > 1:
+                            raise ValidationError(f"Group '{name}': channel name '{ref}' is not unique")
+                        members[key].append(index[ref][0])
+                    else:
+                        members[key].append(index[ref])
+            if not members['channels'] and not members['groups']:
+                raise ValidationError(f"Group '{name}' must contain channels and/or groups")
+            unit = group.get('unit')
+            if not isinstance(unit, int) or isinstance(unit, bool) or not 1 <= unit < EVENT_UNIT_END:
+                raise ValidationError(f"Group '{name}' needs a 'unit' between 1 and {EVENT_UNIT_END - 1} "
+                                      f"(its power device uses the next unit)")
+            parsed.append({'name': name, 'channels': members['channels'], 'groups': members['groups'],
+                           'current_unit': unit, 'power_unit': unit + 1})
+
+        # Nested groups must form a tree (or DAG): no group may contain itself
+        state = [0] * len(parsed)
+
+        def visit(g, path):
+            if state[g] == 1:
+                raise ValidationError(f"Groups contain each other: {' > '.join(path + [parsed[g]['name']])}")
+            if state[g] == 0:
+                state[g] = 1
+                for child in parsed[g]['groups']:
+                    visit(child, path + [parsed[g]['name']])
+                state[g] = 2
+
+        for g in range(len(parsed)):
+            visit(g, [])
+
+        phases = len({c['voltage_idx'] for c in channels if c.get('voltage_idx') is not None})
+        summary_start = ConfigValidator.summary_unit_start(modules)
+        owners = {}
+        for channel in channels:
+            owners[channel['current_unit']] = owners[channel['power_unit']] = f"channel {channel['name']}"
+            if channel.get('switch_unit'):
+                owners[channel['switch_unit']] = f"the switch of channel {channel['name']}"
+        for unit in range(summary_start, summary_start + phases * 2 + 1):
+            owners[unit] = "the phase summaries"
+        for group in parsed:
+            for unit in (group['current_unit'], group['power_unit']):
+                if unit in owners:
+                    raise ValidationError(f"Group '{group['name']}': device unit {unit} is already used by {owners[unit]}")
+                owners[unit] = f"group {group['name']}"
+        return parsed
+
+    @staticmethod
+    def _parse_idx(idx, label):
+        if idx is None:
+            return None
+        try:
+            return int(idx)
+        except (TypeError, ValueError):
+            raise ValidationError(f"{label} must be a Domoticz device IDX")
+
+    @staticmethod
+    def _parse_options(options_json):
+        if not options_json or not options_json.strip():
+            raw = {}
+        else:
+            try:
+                raw = json.loads(options_json)
+            except json.JSONDecodeError as e:
+                raise ValidationError(f"Invalid options JSON format: {e}")
+
+        if not isinstance(raw, dict):
+            raise ValidationError("Advanced options must be a JSON object")
+
+        unknown = sorted(set(raw) - set(DEFAULT_OPTIONS))
+        if unknown:
+            raise ValidationError(f"Unknown option(s): {', '.join(unknown)}")
+
+        options = dict(DEFAULT_OPTIONS)
+        options.update(raw)
+
+        url = options['domoticz_url']
+        if not isinstance(url, str) or urllib.parse.urlsplit(url).scheme not in ('http', 'https'):
+            raise ValidationError("domoticz_url must be an http:// or https:// URL")
+        options['domoticz_url'] = url.rstrip('/')
+
+        ConfigValidator._check_number(options, 'value_ttl', minimum=1)
+        ConfigValidator._check_number(options, 'value_max_age', minimum=options['value_ttl'])
+
+        ttl_per_idx = options['value_ttl_per_idx']
+        if not isinstance(ttl_per_idx, dict):
+            raise ValidationError("value_ttl_per_idx must be an object mapping IDX to seconds")
+        options['value_ttl_per_idx'] = {}
+        for idx, ttl in ttl_per_idx.items():
+            if not isinstance(ttl, (int, float)) or ttl < 1:
+                raise ValidationError(f"value_ttl_per_idx for IDX {idx} must be at least 1 second")
+            options['value_ttl_per_idx'][ConfigValidator._parse_idx(idx, "value_ttl_per_idx key")] = ttl
+
+        if options['shared_cache_file'] is not None:
+            if not isinstance(options['shared_cache_file'], str) or not options['shared_cache_file']:
+                raise ValidationError("shared_cache_file must be a file path or null")
+            if fcntl is None:
+                raise ValidationError("shared_cache_file needs a POSIX system (fcntl)")
+
+        if options['value_fetch'] not in ('bulk', 'per_idx'):
+            raise ValidationError("value_fetch must be 'bulk' or 'per_idx'")
+        ConfigValidator._check_number(options, 'fetch_workers', minimum=1, maximum=16)
+        options['fetch_workers'] = int(options['fetch_workers'])
+        ConfigValidator._check_number(options, 'fetch_deadline', minimum=0.1)
+        ConfigValidator._check_number(options, 'breaker_cooloff', minimum=1)
+
+        if options['acquisition'] not in ('inline', 'thread'):
+            raise ValidationError("acquisition must be 'inline' or 'thread'")
+        if options['poll_interval'] is not None:
+            ConfigValidator._check_number(options, 'poll_interval', minimum=0.1)
+        ConfigValidator._check_number(options, 'buffer_size', minimum=1)
+        options['buffer_size'] = int(options['buffer_size'])
+
+        if options['modbus_session'] not in ('per_read', 'persistent'):
+            raise ValidationError("modbus_session must be 'per_read' or 'persistent'")
+
+        if options['module_polling'] not in ('sequential', 'round_robin', 'concurrent'):
+            raise ValidationError("module_polling must be 'sequential', 'round_robin' or 'concurrent'")
+        ConfigValidator._check_number(options, 'bus_budget', minimum=0)
+
+        deadband = options['deadband']
+        if not isinstance(deadband, dict):
+            raise ValidationError("deadband must be an object keyed by device type")
+        for device_type, band in deadband.items():
+            if device_type not in DEVICE_TYPES:
+                raise ValidationError(f"deadband: unknown device type '{device_type}'")
+            if not isinstance(band, dict) or set(band) - {'absolute', 'relative'}:
+                raise ValidationError(f"deadband.{device_type} must be an object with 'absolute' and/or 'relative'")
+            for key, value in band.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                    raise ValidationError(f"deadband.{device_type}.{key} must be a non-negative number")
+        ConfigValidator._check_number(options, 'publish_refresh', minimum=1)
+        ConfigValidator._check_number(options, 'heartbeat_budget', minimum=0.001)
+
+        if options['metrics_port'] is not None:
+            ConfigValidator._check_number(options, 'metrics_port', minimum=1, maximum=65535)
+            options['metrics_port'] = int(options['metrics_port'])
+        if not isinstance(options['metrics_bind'], str):
+            raise ValidationError("metrics_bind must be an address string")
+        if options['fanout_port'] is not None:
+            ConfigValidator._check_number(options, 'fanout_port', minimum=1, maximum=65535)
+            options['fanout_port'] = int(options['fanout_port'])
+        if not isinstance(options['fanout_bind'], str):
+            raise ValidationError("fanout_bind must be an address string")
+        if options['fanout_max_age'] is not None:
+            ConfigValidator._check_number(options, 'fanout_max_age', minimum=0.1)
+
+        if options['serial_port'] is not None and (not isinstance(options['serial_port'], str) or not options['serial_port']):
+            raise ValidationError("serial_port must be a device path such as /dev/ttyUSB0, or null")
+        if options['serial_baudrate'] not in RTU_BAUDRATES:
+            raise ValidationError(f"serial_baudrate must be one of {', '.join(map(str, RTU_BAUDRATES))}")
+        if options['serial_parity'] not in ('N', 'E', 'O'):
+            raise ValidationError("serial_parity must be 'N', 'E' or 'O'")
+        if options['serial_stopbits'] not in (1, 2):
+            raise ValidationError("serial_stopbits must be 1 or 2")
+        if not isinstance(options['diagnostic_devices'], bool):
+            raise ValidationError("diagnostic_devices must be true or false")
+
+        if options['history_file'] is not None and not isinstance(options['history_file'], str):
+            raise ValidationError("history_file must be a file path")
+        ConfigValidator._check_number(options, 'history_batch', minimum=1)
+        options['history_batch'] = int(options['history_batch'])
+        retention = options['history_retention_days']
+        if not isinstance(retention, dict) or set(retention) - {'raw', 'minute', 'hour'}:
+            raise ValidationError("history_retention_days must be an object with 'raw', 'minute' and/or 'hour'")
+        options['history_retention_days'] = dict(DEFAULT_OPTIONS['history_retention_days'], **retention)
+        for tier, days in options['history_retention_days'].items():
+            if isinstance(days, bool) or not isinstance(days, (int, float)) or days <= 0:
+                raise ValidationError(f"history_retention_days.{tier} must be a positive number of days")
+
+        if options['capture_file'] is not None and not isinstance(options['capture_file'], str):
+            raise ValidationError("capture_file must be a file path")
+        ConfigValidator._check_number(options, 'capture_max_mb', minimum=1)
+
+        if not isinstance(options['adaptive_polling'], bool):
+            raise ValidationError("adaptive_polling must be true or false")
+        for key in ('poll_min_interval', 'poll_max_interval'):
+            if options[key] is not None:
+                ConfigValidator._check_number(options, key, minimum=0.1)
+        if options['poll_min_interval'] and options['poll_max_interval'] and \
+                options['poll_min_interval'] > options['poll_max_interval']:
+            raise ValidationError("poll_min_interval must not exceed poll_max_interval")
+        ConfigValidator._check_number(options, 'change_threshold', minimum=0)
+        ConfigValidator._check_number(options, 'backoff_base', minimum=0.1)
+        ConfigValidator._check_number(options, 'backoff_max', minimum=options['backoff_base'])
+
+        if options['mqtt_host'] is not None and (not isinstance(options['mqtt_host'], str) or not options['mqtt_host']):
+            raise ValidationError("mqtt_host must be a host name or null")
+        ConfigValidator._check_number(options, 'mqtt_port', minimum=1, maximum=65535)
+        options['mqtt_port'] = int(options['mqtt_port'])
+        if not isinstance(options['mqtt_topic'], str) or not options['mqtt_topic']:
+            raise ValidationError("mqtt_topic must be a non-empty string")
+        for key in ('mqtt_username', 'mqtt_password'):
+            if options[key] is not None and not isinstance(options[key], str):
+                raise ValidationError(f"{key} must be a string or null")
+
+        ConfigValidator._check_number(options, 'register_gap', minimum=0, maximum=MODBUS_MAX_REGISTERS)
+        options['register_gap'] = int(options['register_gap'])
+
+        if options['sample_aggregation'] not in (None, 'mean', 'min', 'max'):
+            raise ValidationError("sample_aggregation must be null, 'mean', 'min' or 'max'")
+        if options['sample_aggregation'] and options['acquisition'] != 'thread':
+            raise ValidationError("sample_aggregation requires \"acquisition\": \"thread\"")
+
+        if not isinstance(options['energy'], bool):
+            raise ValidationError("energy must be true or false")
+        if options['energy_file'] is not None and not isinstance(options['energy_file'], str):
+            raise ValidationError("energy_file must be a file path")
+        if not isinstance(options['warm_start'], bool):
+            raise ValidationError("warm_start must be true or false")
+        if options['state_file'] is not None and not isinstance(options['state_file'], str):
+            raise ValidationError("state_file must be a file path")
+
+        if options['compute_engine'] not in ('auto', 'python', 'numpy'):
+            raise ValidationError("compute_engine must be 'auto', 'python' or 'numpy'")
+
+        return options
+
+    @staticmethod
+    def _check_number(options, key, minimum=None, maximum=None):
+        value = options[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValidationError(f"{key} must be a number")
+        if minimum is not None and value < minimum:
+            raise ValidationError(f"{key} must be at least {minimum}")
+        if maximum is not None and value > maximum:
+            raise ValidationError(f"{key} must be at most {maximum}")
+
 class ConnectionHealthMonitor:
     def __init__(self):
         self.consecutive_failures = 0
@@ -193,9 +1076,11 @@ class ConnectionHealthMonitor:
 
     def record_success(self):
         self.consecutive_failures = 0
+        metrics.inc('hpm_modbus_reads_total')
 
     def record_failure(self):
         self.consecutive_failures += 1
+        metrics.inc('hpm_modbus_failures_total')
 
     def should_reset_connection(self):
         return (self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES and
@@ -204,87 +1089,1096 @@ class ConnectionHealthMonitor:
     def reset_connection_attempted(self):
         self.last_reset_time = time.time()
         self.consecutive_failures = 0
+        metrics.inc('hpm_modbus_connection_resets_total')
+
+class RetryBackoff:
+    """Exponential backoff with jitter for one Modbus unit."""
+
+    def __init__(self, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+        self.base = base
+        self.maximum = maximum
+        self.failures = 0
+        self.retry_at = 0
+
+    def ready(self):
+        return time.monotonic() >= self.retry_at
+
+    def success(self):
+        self.failures = 0
+        self.retry_at = 0
+
+    def failure(self):
+        delay = min(self.maximum, self.base * 2 ** self.failures)
+        delay = random.uniform(delay / 2, delay)
+        self.failures += 1
+        self.retry_at = time.monotonic() + delay
+        return delay
+
+class CircuitBreaker:
+    """Stops requests to an unresponsive service and lets a probe through after a cool-off."""
+
+    def __init__(self, name, threshold=BREAKER_FAILURES, cooloff=30):
+        self.name = name
+        self.threshold = threshold
+        self.cooloff = RetryBackoff(cooloff, cooloff * 8)
+        self.failures = 0
+        self.state = 'closed'
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'open' and self.cooloff.ready():
+                self.state = 'half_open'
+                return True
+            if self.state != 'closed':
+                metrics.inc('hpm_breaker_rejected_total', breaker=self.name)
+            return self.state == 'closed'
+
+    def available(self):
+        """Whether allow() would let a request through, without starting a probe."""
+        return self.state == 'closed' or (self.state == 'open' and self.cooloff.ready())
+
+    def success(self):
+        with self.lock:
+            if self.state != 'closed':
+                logger.info("%s responding again, resuming requests", self.name)
+                metrics.set('hpm_breaker_open', 0, breaker=self.name)
+            self.state = 'closed'
+            self.failures = 0
+            self.cooloff.success()
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                delay = self.cooloff.failure()
+                if self.state == 'closed':
+                    metrics.set('hpm_breaker_open', 1, breaker=self.name)
+                logger.warning("%s not responding after %d attempt(s), pausing requests for %.0fs",
+                               self.name, self.failures, delay, key=('breaker', self.name))
+                self.state = 'open'
+
+class DomoticzAPI:
+    """Persistent keep-alive connection to the Domoticz JSON API."""
+
+    def __init__(self, base_url, timeout=HTTP_TIMEOUT):
+        self.base_url = base_url
+        parts = urllib.parse.urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.https = parts.scheme == 'https'
+        self.path_prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.headers = {'Connection': 'keep-alive'}
+        if parts.username:
+            credentials = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+            self.headers['Authorization'] = f"Basic {base64.b64encode(credentials.encode('utf-8')).decode('ascii')}"
+        self.connection = None
+
+    def get_json(self, params):
+        path = f"{self.path_prefix}/json.htm?{urllib.parse.urlencode(params)}"
+        reused = self.connection is not None
+        try:
+            return self._request(path)
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                ConnectionResetError, BrokenPipeError):
+            self.close()
+            if not reused:
+                raise
+            # The server closed an idle keep-alive connection; retry once on a fresh one
+            return self._request(path)
+        except Exception:
+            self.close()
+            raise
+
+    def _request(self, path):
+        if self.connection is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.connection = connection_class(self.host, self.port, timeout=self.timeout)
+
+        self.connection.request('GET', path, headers=self.headers)
+        response = self.connection.getresponse()
+        body = response.read()
+        if response.will_close:
+            self.close()
+
+        if response.status != 200:
+            raise http.client.HTTPException(f"HTTP {response.status} for {path}")
+        return json.loads(body.decode('utf-8'))
+
+    def close(self):
+        if self.connection:
+            try:
+                self.connection.close()
+            except:
+                pass
+            self.connection = None
+
+class FetchPlan:
+    """Unique voltage/PF device IDXs referenced by the channel configuration."""
+
+    def __init__(self, channels):
+        self.voltage_idxs = sorted({c['voltage_idx'] for c in channels if c.get('voltage_idx') is not None})
+        self.pf_idxs = sorted({c['pf_idx'] for c in channels if c.get('pf_idx') is not None})
+        self.idxs = sorted(set(self.voltage_idxs) | set(self.pf_idxs))
 
 class ValueFetcher:
-    @staticmethod
-    def get_value_from_idx(idx, value_name="value"):
-        if idx is None:
+    """Resolves voltage/PF IDXs through the Domoticz JSON API."""
+
+    def __init__(self, api, mode='bulk', workers=4, deadline=HTTP_TIMEOUT, breaker=None):
+        self.api = api
+        self.mode = mode
+        self.workers = workers
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker("Domoticz API")
+        self.executor = None
+        self.in_flight = {}
+        self.local = threading.local()
+        self.worker_apis = []
+        self.lock = threading.Lock()
+
+    def fetch_values(self, idxs):
+        """Resolve IDXs, returning {idx: value} for the ones that could be read."""
+        if not idxs:
+            return {}
+        if not self.breaker.allow():
+            logger.debug("Fetching IDX %s: skipped, Domoticz API not responding", ', '.join(map(str, idxs)))
+            return {}
+
+        if self.mode == 'per_idx':
+            # While probing, one request tells whether Domoticz is back
+            values = self._fetch_concurrent(idxs[:1] if self.breaker.state == 'half_open' else idxs)
+        else:
+            values = self._fetch_bulk(idxs)
+        if values is None:
+            self.breaker.failure()
+            return {}
+        self.breaker.success()
+
+        if logger.debug_mode:
+            missing = set(idxs) - set(values)
+            if missing:
+                logger.debug("Devices IDX %s: Not found or unreadable", ', '.join(map(str, sorted(missing))))
+            logger.debug("Fetched %s/%s dynamic values: %s", len(values), len(idxs), values)
+        return values
+
+    def _fetch_bulk(self, idxs):
+        params = {'type': 'command', 'param': 'getdevices'}
+        if len(idxs) == 1:
+            params['rid'] = idxs[0]
+        else:
+            params['filter'] = 'all'
+
+        try:
+            with metrics.timer('hpm_http_fetch_seconds'):
+                return ValueFetcher._parse(self.api.get_json(params), idxs)
+        except Exception as e:
+            metrics.inc('hpm_http_errors_total')
+            logger.debug("Fetching IDX %s: Error - %s", ', '.join(map(str, idxs)), e)
             return None
 
+    def _fetch_concurrent(self, idxs):
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                                  thread_name_prefix="HPM-Fetch")
+        self.in_flight = {idx: future for idx, future in self.in_flight.items() if not future.done()}
+        futures = {self.executor.submit(self._fetch_one, idx): idx for idx in idxs if idx not in self.in_flight}
+        done, late = concurrent.futures.wait(futures, timeout=self.deadline)
+
+        values = {}
+        for future in done:
+            if future.exception() is None and future.result() is not None:
+                values[futures[future]] = future.result()
+        for future in late:
+            self.in_flight[futures[future]] = future
+            metrics.inc('hpm_http_deadline_misses_total')
+        if late:
+            logger.debug("Fetching IDX %s: no answer within %ss, using last known values",
+                         ', '.join(str(futures[future]) for future in late), self.deadline)
+
+        # Nothing answered (errors, or every request late or still running from an earlier round)
+        answered = sum(1 for future in done if future.exception() is None)
+        return values if answered else None
+
+    def _fetch_one(self, idx):
+        api = getattr(self.local, 'api', None)
+        if api is None:
+            api = self.local.api = DomoticzAPI(self.api.base_url, self.api.timeout)
+            with self.lock:
+                self.worker_apis.append(api)
         try:
-            target_idx = int(idx)
-            url = f"http://127.0.0.1:8080/json.htm?type=command&param=getdevices&rid={target_idx}"
-            logger.debug(f"Fetching from URL: {url}")
+            with metrics.timer('hpm_http_fetch_seconds'):
+                data = api.get_json({'type': 'command', 'param': 'getdevices', 'rid': idx})
+        except Exception as e:
+            metrics.inc('hpm_http_errors_total')
+            logger.debug("Fetching IDX %s: Error - %s", idx, e)
+            raise
+        return ValueFetcher._parse(data, [idx]).get(idx)
 
+    @staticmethod
+    def _parse(data, idxs):
+        if data.get('status') != 'OK':
+            raise ValueError(f"status {data.get('status')}")
+
+        wanted = set(idxs)
+        values = {}
+        for device_data in data.get('result') or []:
             try:
-                with urllib.request.urlopen(url, timeout=3) as response:
-                    if response.getcode() == 200:
-                        data = json.loads(response.read().decode('utf-8'))
-
-                        if data.get('status') == 'OK' and data.get('result') and len(data['result']) > 0:
-                            device_data = data['result'][0]
-
-                            if 'Voltage' in device_data:
-                                try:
-                                    value = float(device_data['Voltage'])
-                                    logger.debug(f"Device IDX {idx}: {value_name} = {value} (Voltage)")
-                                    return value
-                                except ValueError:
-                                    pass
-
-                            if 'Data' in device_data:
-                                try:
-                                    value = float(device_data['Data'].split(' ')[0])
-                                    logger.debug(f"Device IDX {idx}: {value_name} = {value} (Data)")
-                                    return value
-                                except ValueError:
-                                    pass
-
-                            logger.debug(f"Device IDX {idx}: No readable value found")
+                idx = int(device_data.get('idx'))
+            except (TypeError, ValueError):
+                continue
+            if idx not in wanted:
+                continue
 
-            except Exception as e:
-                logger.debug(f"Device IDX {idx}: Error - {e}")
+            value = ValueFetcher._extract_value(device_data)
+            if value is None:
+                logger.debug("Device IDX %s: No readable value found", idx)
+                continue
+            values[idx] = value
+        return values
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        with self.lock:
+            for api in self.worker_apis:
+                api.close()
+            self.worker_apis = []
 
-        except ValueError:
-            logger.debug(f"Device IDX {idx}: Invalid IDX format")
+    @staticmethod
+    def _extract_value(device_data):
+        if 'Voltage' in device_data:
+            try:
+                return float(device_data['Voltage'])
+            except (TypeError, ValueError):
+                pass
+
+        if 'Data' in device_data:
+            try:
+                return float(str(device_data['Data']).split(' ')[0])
+            except ValueError:
+                pass
 
         return None
 
+class SharedValueTable:
+    """Voltage/PF values shared by all HPM instances on this host through a memory-mapped file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.slots = {}
+        self.lock = threading.Lock()
+        size = SHARED_HEADER.size + SHARED_SLOTS * SHARED_RECORD.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            with self._locked(fcntl.LOCK_EX):
+                if os.fstat(self.fd).st_size != size:
+                    os.ftruncate(self.fd, size)
+                self.map = mmap.mmap(self.fd, size)
+                header = SHARED_HEADER.unpack_from(self.map, 0)
+                if header != (SHARED_FILE_MAGIC, SHARED_FILE_VERSION, SHARED_SLOTS):
+                    self.map[:] = b'\0' * size
+                    SHARED_HEADER.pack_into(self.map, 0, SHARED_FILE_MAGIC, SHARED_FILE_VERSION, SHARED_SLOTS)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    @contextmanager
+    def _locked(self, operation):
+        # flock only excludes other open file descriptions; threads of this instance share self.fd
+        with self.lock:
+            fcntl.flock(self.fd, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _offset(slot):
+        return SHARED_HEADER.size + slot * SHARED_RECORD.size
+
+    def _slot(self, idx, create=False):
+        # Slots are never freed, so a slot once found stays valid; other instances may add IDXs at any time
+        if idx in self.slots:
+            return self.slots[idx]
+        free = None
+        for slot in range(SHARED_SLOTS):
+            key = SHARED_RECORD.unpack_from(self.map, self._offset(slot))[0]
+            if key == idx:
+                self.slots[idx] = slot
+                return slot
+            if key == 0 and free is None:
+                free = slot
+        if create and free is not None:
+            SHARED_RECORD.pack_into(self.map, self._offset(free), idx, 0.0, 0.0, 0.0)
+            self.slots[idx] = free
+            return free
+        return None
+
+    def read(self, idxs):
+        """Return {idx: (value, fetched_at)} for every IDX any instance has fetched (wall clock time)."""
+        values = {}
+        with self._locked(fcntl.LOCK_SH):
+            for idx in idxs:
+                slot = self._slot(idx)
+                if slot is None:
+                    continue
+                _, value, fetched_at, _ = SHARED_RECORD.unpack_from(self.map, self._offset(slot))
+                if fetched_at:
+                    values[idx] = (value, fetched_at)
+        return values
+
+    def claim(self, idxs, ttls):
+        """Claim the refresh of the IDXs that are past their TTL and not claimed by another instance."""
+        now = time.time()
+        claimed = []
+        with self._locked(fcntl.LOCK_EX):
+            for idx in idxs:
+                slot = self._slot(idx, create=True)
+                if slot is None:
+                    # Table full: this instance fetches the IDX on its own
+                    claimed.append(idx)
+                    continue
+                _, value, fetched_at, claimed_until = SHARED_RECORD.unpack_from(self.map, self._offset(slot))
+                if now - fetched_at < ttls[idx] or claimed_until > now:
+                    continue
+                SHARED_RECORD.pack_into(self.map, self._offset(slot), idx, value, fetched_at,
+                                        now + SHARED_CLAIM_SECONDS)
+                claimed.append(idx)
+        return claimed
+
+    def store(self, values):
+        """Publish freshly fetched values and release their claims; returns the fetch time recorded."""
+        now = time.time()
+        with self._locked(fcntl.LOCK_EX):
+            for idx, value in values.items():
+                slot = self._slot(idx, create=True)
+                if slot is not None:
+                    SHARED_RECORD.pack_into(self.map, self._offset(slot), idx, value, now, 0.0)
+        return now
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+class ValueCache:
+    """Last known dynamic values, refreshed in the background (stale-while-revalidate)."""
+
+    def __init__(self, value_fetcher, idxs, ttl, max_age, ttl_per_idx=None, shared=None):
+        self.value_fetcher = value_fetcher
+        self.idxs = list(idxs)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.ttl_per_idx = ttl_per_idx or {}
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.refresh_thread = None
+        self.pushed = set()
+        self.push_active = False
+        self.shared = shared
+        self.shared_seen = {}
+        if shared:
+            self._adopt_shared()
+
+    def get_values(self):
+        if self.shared:
+            self._adopt_shared()
+        now = time.monotonic()
+        with self.lock:
+            values = {}
+            expired = []
+            for idx in self.idxs:
+                entry = self.entries.get(idx)
+                if entry is None:
+                    expired.append(idx)
+                    continue
+                value, fetched_at = entry
+                age = now - fetched_at
+                if age <= self.max_age:
+                    values[idx] = value
+                ttl = self.ttl_per_idx.get(idx, self.ttl)
+                if self.push_active and idx in self.pushed:
+                    # While pushes arrive, HTTP only re-checks devices that went quiet, early enough to
+                    # replace the value before it expires
+                    ttl = max(ttl, self.max_age / 2)
+                if age >= ttl:
+                    expired.append(idx)
+
+        if expired:
+            self.refresh(expired)
+        return values
+
+    def refresh(self, idxs=None):
+        """Start a background refresh unless one is already running."""
+        with self.lock:
+            if self.refresh_thread and self.refresh_thread.is_alive():
+                return
+            if not self.value_fetcher.breaker.available():
+                return
+            idxs = list(idxs or self.idxs)
+            if self.shared:
+                idxs = self.shared.claim(idxs, {idx: self.ttl_per_idx.get(idx, self.ttl) for idx in idxs})
+                if not idxs:
+                    return
+            self.refresh_thread = threading.Thread(
+                target=self._refresh, args=(idxs,),
+                name="HPM-ValueRefresh", daemon=True
+            )
+            self.refresh_thread.start()
+
+    def _refresh(self, idxs):
+        values = self.value_fetcher.fetch_values(idxs)
+        fetched_at = time.monotonic()
+        shared_at = self.shared.store(values) if self.shared and values else None
+        with self.lock:
+            for idx, value in values.items():
+                self.entries[idx] = (value, fetched_at)
+                if shared_at:
+                    self.shared_seen[idx] = shared_at
+        if len(values) < len(idxs):
+            logger.debug("Value refresh: %d/%d IDXs updated, serving last known values for the rest",
+                         len(values), len(idxs))
+
+    def _adopt_shared(self):
+        shared = self.shared.read(self.idxs)
+        wall_now, now = time.time(), time.monotonic()
+        with self.lock:
+            for idx, (value, shared_at) in shared.items():
+                if shared_at <= self.shared_seen.get(idx, 0.0):
+                    continue
+                self.shared_seen[idx] = shared_at
+                fetched_at = now - (wall_now - shared_at)
+                entry = self.entries.get(idx)
+                if entry is None or entry[1] < fetched_at:
+                    self.entries[idx] = (value, fetched_at)
+                    metrics.inc('hpm_shared_values_total')
+
+    def snapshot(self):
+        """Return {idx: (value, fetched_at)} with wall clock fetch times, for the warm start snapshot."""
+        wall_now, now = time.time(), time.monotonic()
+        with self.lock:
+            return {idx: (value, wall_now - (now - fetched_at)) for idx, (value, fetched_at) in self.entries.items()}
+
+    def restore(self, values):
+        """Load values from snapshot(); values older than max_age are skipped. Returns the number restored."""
+        wall_now, now = time.time(), time.monotonic()
+        restored = 0
+        with self.lock:
+            for idx, (value, fetched_at) in values.items():
+                age = max(0.0, wall_now - fetched_at)
+                if idx in self.idxs and age <= self.max_age and idx not in self.entries:
+                    self.entries[idx] = (value, now - age)
+                    restored += 1
+        return restored
+
+    def push(self, idx, value):
+        """Store a value pushed by the MQTT subscriber."""
+        with self.lock:
+            self.entries[idx] = (value, time.monotonic())
+            self.pushed.add(idx)
+
+    def set_push_active(self, active):
+        with self.lock:
+            self.push_active = active
+
+    def stop(self, timeout=HTTP_TIMEOUT):
+        thread = self.refresh_thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+        self.value_fetcher.close()
+        if self.shared:
+            self.shared.close()
+
+class MQTTSubscriber:
+    """Minimal MQTT 3.1.1 client following Domoticz device updates on domoticz/out."""
+
+    def __init__(self, host, port, topic, value_cache, idxs, client_id, username=None, password=None,
+                 keepalive=MQTT_KEEPALIVE):
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.value_cache = value_cache
+        self.idxs = set(idxs)
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.sock = None
+        self.last_sent = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.messages = 0
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="HPM-MQTT", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        sock = self.sock
+        if sock:
+            try:
+                sock.sendall(b'\xe0\x00')  # DISCONNECT
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+        self.thread = None
+
+    def _run(self):
+        backoff = RetryBackoff(maximum=self.keepalive)
+        while not self.stop_event.is_set():
+            try:
+                self._connect()
+                backoff.success()
+                self.value_cache.set_push_active(True)
+                metrics.set('hpm_mqtt_connected', 1)
+                logger.info("Subscribed to %s on MQTT broker %s:%s", self.topic, self.host, self.port)
+                self._receive()
+            except (OSError, ValueError, struct.error) as e:
+                if not self.stop_event.is_set():
+                    logger.debug("MQTT connection to %s:%s lost: %s", self.host, self.port, e)
+            finally:
+                self.value_cache.set_push_active(False)
+                metrics.set('hpm_mqtt_connected', 0)
+                self._close()
+            if not self.stop_event.is_set():
+                delay = backoff.failure()
+                logger.debug("MQTT reconnect in %.1fs, using HTTP for dynamic values meanwhile", delay)
+                self.stop_event.wait(delay)
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=HTTP_TIMEOUT)
+        flags = 0x02  # clean session
+        payload = self._string(self.client_id)
+        if self.username is not None:
+            flags |= 0x80
+            payload += self._string(self.username)
+            if self.password is not None:
+                flags |= 0x40
+                payload += self._string(self.password)
+        header = self._string('MQTT') + bytes([4, flags]) + struct.pack('>H', self.keepalive)
+        self._send(0x10, header + payload)
+
+        packet_type, body = self._read_packet()
+        if packet_type != 0x20 or len(body) < 2 or body[1] != 0:
+            raise ValueError(f"connection refused (CONNACK {body.hex()})")
+
+        self._send(0x82, struct.pack('>H', 1) + self._string(self.topic) + b'\x00')
+        packet_type, body = self._read_packet()
+        if packet_type != 0x90 or len(body) < 3 or body[2] == 0x80:
+            raise ValueError(f"subscription to {self.topic} refused")
+
+    def _receive(self):
+        last_received = time.monotonic()
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if now - last_received > self.keepalive * 1.5:
+                raise ValueError("broker stopped responding")
+            # The broker only counts packets sent by the client towards the keepalive,
+            # so ping when sending went quiet, however busy domoticz/out is
+            if now - self.last_sent >= self.keepalive / 2:
+                self._send(0xC0, b'')  # PINGREQ
+            self.sock.settimeout(max(self.last_sent + self.keepalive / 2 - now, 0.1))
+            try:
+                first = self._recv_exact(1)[0]
+            except socket.timeout:
+                continue
+            # Only the wait for a packet may time out; one cut in half would desync the stream
+            self.sock.settimeout(self.keepalive)
+            packet_type, body = self._read_packet(first)
+            last_received = time.monotonic()
+            if packet_type & 0xF0 == 0x30:
+                self._handle_publish(packet_type, body)
+
+    def _handle_publish(self, packet_type, body):
+        topic_length = struct.unpack_from('>H', body)[0]
+        offset = 2 + topic_length
+        qos = (packet_type >> 1) & 0x03
+        if qos:
+            self._send(0x40, body[offset:offset + 2])  # PUBACK
+            offset += 2
+
+        try:
+            message = json.loads(body[offset:])
+            idx = int(message.get('idx'))
+        except (ValueError, TypeError, AttributeError):
+            return
+        if idx not in self.idxs:
+            return
+
+        value = self._extract_value(message)
+        if value is None:
+            logger.debug("MQTT update for IDX %s: No readable value found", idx)
+            return
+        self.value_cache.push(idx, value)
+        self.messages += 1
+        metrics.inc('hpm_mqtt_messages_total')
+
     @staticmethod
-    def get_phase_values(channels, phase_groups):
-        phase_values = {}
-        for vidx in phase_groups:
-            # Find a representative channel for this phase to fetch voltage and PF
-            for channel_idx in phase_groups[vidx]:
-                channel = channels[channel_idx]
-                voltage = channel['voltage']
-                pf = channel['pf']
-
-                if channel.get('voltage_idx'):
-                    dynamic_voltage = ValueFetcher.get_value_from_idx(channel['voltage_idx'], "voltage")
-                    if dynamic_voltage is not None and dynamic_voltage > 0:
-                        voltage = dynamic_voltage
-                        logger.debug(f"Phase IDX {vidx}: Using dynamic voltage {voltage}V")
-
-                if channel.get('pf_idx'):
-                    dynamic_pf = ValueFetcher.get_value_from_idx(channel['pf_idx'], "power factor")
-                    if dynamic_pf is not None and 0 < dynamic_pf <= 1:
-                        pf = dynamic_pf
-                        logger.debug(f"Phase IDX {vidx}: Using dynamic PF {pf}")
-
-                phase_values[vidx] = {'voltage': voltage, 'pf': pf}
-                break  # Use the first valid channel for this phase
-        return phase_values
+    def _extract_value(message):
+        raw = message.get('svalue1')
+        if raw is None:
+            raw = str(message.get('svalue', '')).split(';')[0]
+        try:
+            return float(str(raw).split(' ')[0])
+        except ValueError:
+            return None
+
+    def _read_packet(self, first=None):
+        if first is None:
+            first = self._recv_exact(1)[0]
+        length = 0
+        for shift in range(0, 28, 7):
+            byte = self._recv_exact(1)[0]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+        return first, self._recv_exact(length) if length else b''
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by broker")
+            data += chunk
+        return data
+
+    def _send(self, packet_type, body):
+        length = len(body)
+        encoded = bytearray()
+        while True:
+            byte = length & 0x7F
+            length >>= 7
+            encoded.append(byte | 0x80 if length else byte)
+            if not length:
+                break
+        self.sock.sendall(bytes([packet_type]) + bytes(encoded) + body)
+        self.last_sent = time.monotonic()
+
+    @staticmethod
+    def _string(value):
+        data = value.encode('utf-8')
+        return struct.pack('>H', len(data)) + data
+
+    def _close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+class PlanResult:
+    __slots__ = ('present', 'currents', 'current_valid', 'powers', 'power_valid',
+                 'phase_currents', 'phase_powers', 'total_power', 'voltages', 'pfs')
+
+class ChannelPlan:
+    """Channel configuration compiled into flat arrays for a single-pass computation."""
+
+    __slots__ = ('count', 'phases', 'phase_of', 'current_units', 'power_units',
+                 'static_voltage', 'static_pf', 'dynamic_voltage', 'dynamic_pf', 'use_numpy', 'np_phase_of')
+
+    def __init__(self, channels, phases, use_numpy=False):
+        self.count = len(channels)
+        self.phases = list(phases)
+        position = {vidx: i for i, vidx in enumerate(self.phases)}
+        self.phase_of = array('i', [position.get(c.get('voltage_idx'), -1) for c in channels])
+        self.current_units = array('H', [c['current_unit'] for c in channels])
+        self.power_units = array('H', [c['power_unit'] for c in channels])
+        self.static_voltage = array('d', [float(c['voltage']) for c in channels])
+        self.static_pf = array('d', [float(c['pf']) for c in channels])
+        self.dynamic_voltage = tuple((i, c['voltage_idx']) for i, c in enumerate(channels) if c.get('voltage_idx') is not None)
+        self.dynamic_pf = tuple((i, c['pf_idx']) for i, c in enumerate(channels) if c.get('pf_idx') is not None)
+        self.use_numpy = use_numpy and numpy is not None
+        self.np_phase_of = numpy.array(self.phase_of, dtype=numpy.intp) if self.use_numpy else None
+
+    def resolve(self, values):
+        """Per-channel voltage and PF arrays, preferring valid dynamic values over the static config."""
+        voltages = array('d', self.static_voltage)
+        pfs = array('d', self.static_pf)
+        for i, idx in self.dynamic_voltage:
+            value = values.get(idx)
+            if value is not None and value > 0:
+                voltages[i] = value
+        for i, idx in self.dynamic_pf:
+            value = values.get(idx)
+            if value is not None and 0 < value <= 1:
+                pfs[i] = value
+        return voltages, pfs
+
+    def compute(self, registers, values):
+        voltages, pfs = self.resolve(values)
+        if self.use_numpy:
+            result = self._compute_numpy(registers, voltages, pfs)
+        else:
+            result = self._compute_python(registers, voltages, pfs)
+        result.voltages = voltages
+        result.pfs = pfs
+        return result
+
+    def _compute_python(self, registers, voltages, pfs):
+        n = self.count
+        present = bytearray(n)
+        current_valid = bytearray(n)
+        power_valid = bytearray(n)
+        currents = array('d', [0.0]) * n
+        powers = array('d', [0.0]) * n
+        phase_currents = [0.0] * len(self.phases)
+        phase_powers = [0.0] * len(self.phases)
+        total_power = 0.0
+        phase_of = self.phase_of
+
+        for i in range(min(n, len(registers))):
+            raw = registers[i]
+            if raw is None:
+                continue
+            present[i] = 1
+            amperes = raw * CURRENT_MULTIPLIER
+            currents[i] = amperes
+            amperes_ok = 0 <= amperes <= MAX_CURRENT
+            current_valid[i] = amperes_ok
+
+            phase = phase_of[i]
+            if phase < 0:
+                continue
+            watts = voltages[i] * amperes * pfs[i]
+            powers[i] = watts
+            if amperes_ok:
+                phase_currents[phase] += amperes
+            if 0 <= watts <= MAX_POWER:
+                power_valid[i] = 1
+                phase_powers[phase] += watts
+                total_power += watts
+
+        result = PlanResult()
+        result.present = present
+        result.currents = currents
+        result.current_valid = current_valid
+        result.powers = powers
+        result.power_valid = power_valid
+        result.phase_currents = phase_currents
+        result.phase_powers = phase_powers
+        result.total_power = total_power
+        return result
+
+    def _compute_numpy(self, registers, voltages, pfs):
+        n = self.count
+        raw = numpy.full(n, numpy.nan)
+        values = [numpy.nan if value is None else value for value in registers[:n]]
+        raw[:len(values)] = values
+
+        present = ~numpy.isnan(raw)
+        amperes = numpy.where(present, raw * CURRENT_MULTIPLIER, 0.0)
+        current_valid = present & (amperes >= 0) & (amperes <= MAX_CURRENT)
+        has_phase = present & (self.np_phase_of >= 0)
+        watts = numpy.where(has_phase, numpy.frombuffer(voltages) * amperes * numpy.frombuffer(pfs), 0.0)
+        power_valid = has_phase & (watts >= 0) & (watts <= MAX_POWER)
+
+        phase_count = len(self.phases)
+        summed_currents = current_valid & has_phase
+        phase_currents = numpy.bincount(self.np_phase_of[summed_currents], weights=amperes[summed_currents],
+                                        minlength=phase_count)
+        phase_powers = numpy.bincount(self.np_phase_of[power_valid], weights=watts[power_valid],
+                                      minlength=phase_count)
+
+        result = PlanResult()
+        result.present = present.tolist()
+        result.currents = amperes.tolist()
+        result.current_valid = current_valid.tolist()
+        result.powers = watts.tolist()
+        result.power_valid = power_valid.tolist()
+        result.phase_currents = phase_currents.tolist()
+        result.phase_powers = phase_powers.tolist()
+        result.total_power = float(sum(result.phase_powers))
+        return result
+
+class PublishFilter:
+    """Change-only publishing: skips device updates that stay within the deadband."""
+
+    def __init__(self, deadband, refresh_interval):
+        self.deadband = {
+            device_type: (band.get('absolute', 0), band.get('relative', 0))
+            for device_type, band in deadband.items()
+        }
+        self.refresh_interval = refresh_interval
+        self.last_published = {}
+        self.sent = 0
+        self.suppressed = 0
+
+    def should_publish(self, unit, device_type, value, now):
+        band = self.deadband.get(device_type)
+        last = self.last_published.get(unit)
+        if band is not None and last is not None:
+            last_value, published_at = last
+            threshold = max(band[0], band[1] * abs(last_value))
+            if abs(value - last_value) <= threshold and now - published_at < self.refresh_interval:
+                self.suppressed += 1
+                return False
+
+        self.last_published[unit] = (value, now)
+        self.sent += 1
+        return True
+
+    def summary(self):
+        total = self.sent + self.suppressed
+        ratio = 100.0 * self.suppressed / total if total else 0.0
+        return f"{self.sent} sent, {self.suppressed} suppressed ({ratio:.0f}%)"
+
+class EnergyStore:
+    """Fixed-layout memory-mapped table of energy counters."""
+
+    def __init__(self, path):
+        self.path = path
+        size = ENERGY_HEADER.size + ENERGY_SLOTS * ENERGY_RECORD.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, version, slots = ENERGY_HEADER.unpack_from(self.map, 0)
+        if (magic, version, slots) != (ENERGY_FILE_MAGIC, ENERGY_FILE_VERSION, ENERGY_SLOTS):
+            if magic != b'\0' * 4:
+                logger.warning("Energy file %s has an unknown layout, starting from zero", path)
+            self.map[:] = b'\0' * size
+            ENERGY_HEADER.pack_into(self.map, 0, ENERGY_FILE_MAGIC, ENERGY_FILE_VERSION, ENERGY_SLOTS)
+
+        self.slots = {}
+        for slot in range(ENERGY_SLOTS):
+            key = ENERGY_RECORD.unpack_from(self.map, self._offset(slot))[0]
+            if key:
+                self.slots[key] = slot
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def _offset(slot):
+        return ENERGY_HEADER.size + slot * ENERGY_RECORD.size
+
+    def slot(self, key):
+        if key not in self.slots:
+            free = set(range(ENERGY_SLOTS)) - set(self.slots.values())
+            if not free:
+                raise ValueError(f"Energy file {self.path} is full")
+            slot = min(free)
+            ENERGY_RECORD.pack_into(self.map, self._offset(slot), key, 0.0, 0.0, 0.0)
+            self.slots[key] = slot
+        return self.slots[key]
+
+    def read(self, slot):
+        _, energy, last_power, last_time = ENERGY_RECORD.unpack_from(self.map, self._offset(slot))
+        return energy, last_power, last_time
+
+    def write(self, slot, key, energy, last_power=0.0, last_time=0.0):
+        ENERGY_RECORD.pack_into(self.map, self._offset(slot), key, energy, last_power, last_time)
+
+    def flush(self):
+        self.map.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.map.close()
+
+class EnergyAccumulator:
+    """Per-channel, per-phase and total energy in Wh, integrated over every sample."""
+
+    def __init__(self, store, channels, max_gap=ENERGY_MAX_GAP):
+        self.store = store
+        self.max_gap = max_gap
+        self.lock = threading.Lock()
+        # Power is only computed for channels assigned to a phase (voltage_idx)
+        phases = sorted({channel['voltage_idx'] for channel in channels if channel.get('voltage_idx') is not None})
+        self.channel_keys = [channel['power_unit'] if channel.get('voltage_idx') is not None else None
+                             for channel in channels]
+        self.channel_slots = [store.slot(key) if key else None for key in self.channel_keys]
+        self.channel_phases = [channel.get('voltage_idx') for channel in channels]
+
+        count = len(channels)
+        self.energy = array('d', [0.0]) * count
+        self.last_power = array('d', [0.0]) * count
+        self.last_time = array('d', [0.0]) * count
+        for i, slot in enumerate(self.channel_slots):
+            if slot is not None:
+                self.energy[i], self.last_power[i], self.last_time[i] = store.read(slot)
+
+        self.phase_slots = {vidx: store.slot(ENERGY_PHASE_KEY | vidx) for vidx in phases}
+        self.phase_energy = {vidx: store.read(slot)[0] for vidx, slot in self.phase_slots.items()}
+        self.total_slot = store.slot(ENERGY_TOTAL_KEY)
+        self.total_energy = store.read(self.total_slot)[0]
+
+    def add_sample(self, timestamp, powers, fresh=None):
+        with self.lock:
+            for i, power in enumerate(powers):
+                slot = self.channel_slots[i]
+                if slot is None or (fresh is not None and not fresh[i]):
+                    # Carried-over values are no new sample; the next read integrates the whole gap
+                    continue
+                if power is None:
+                    self.last_time[i] = 0.0
+                    self.store.write(slot, self.channel_keys[i], self.energy[i])
+                    continue
+
+                dt = timestamp - self.last_time[i]
+                if 0 < dt <= self.max_gap:
+                    increment = (self.last_power[i] + power) / 2 * dt / 3600
+                    self.energy[i] += increment
+                    self.phase_energy[self.channel_phases[i]] += increment
+                    self.total_energy += increment
+
+                self.last_power[i] = power
+                self.last_time[i] = timestamp
+                self.store.write(slot, self.channel_keys[i], self.energy[i], power, timestamp)
+
+            for vidx, slot in self.phase_slots.items():
+                self.store.write(slot, ENERGY_PHASE_KEY | vidx, self.phase_energy[vidx])
+            self.store.write(self.total_slot, ENERGY_TOTAL_KEY, self.total_energy)
+
+            if time.monotonic() - self.store.last_flush >= ENERGY_FLUSH_INTERVAL:
+                self.store.flush()
+
+    def channel_wh(self, channel_idx):
+        return self.energy[channel_idx]
+
+    def phase_wh(self, vidx):
+        return self.phase_energy.get(vidx, 0.0)
+
+    def total_wh(self):
+        return self.total_energy
+
+    def close(self):
+        with self.lock:
+            self.store.close()
+
+class StateStore:
+    """JSON snapshot of the state needed for a warm start, replaced atomically on every save."""
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.last_save = time.monotonic()
+
+    @staticmethod
+    def fingerprint_of(modules, channels):
+        layout = [[(m.get('host'), m.get('port'), m['unit_id']) for m in modules],
+                  [(c['name'], c['current_unit'], c['power_unit'], c.get('voltage_idx'), c.get('pf_idx'))
+                   for c in channels]]
+        return hashlib.sha1(json.dumps(layout).encode('utf-8')).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable state file %s: %s", self.path, e)
+            return None
+
+        if not isinstance(state, dict) or state.get('version') != STATE_FILE_VERSION:
+            return None
+        if state.get('fingerprint') != self.fingerprint:
+            logger.info("Configuration changed since the last snapshot, starting cold")
+            return None
+        age = time.time() - state.get('saved_at', 0)
+        if not 0 <= age <= STATE_MAX_AGE:
+            logger.info("Snapshot in %s is %.0fs old, starting cold", self.path, age)
+            return None
+        return state
+
+    def save(self, state):
+        state = dict(state, version=STATE_FILE_VERSION, fingerprint=self.fingerprint, saved_at=time.time())
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(state, f, separators=(',', ':'))
+            os.replace(temporary, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error("Saving state to %s failed: %s", self.path, e, key='state_save')
+        self.last_save = time.monotonic()
+
+class AggregationTree:
+    """Nested channel groups with sums updated incrementally from per-channel changes."""
+
+    def __init__(self, groups, channel_count):
+        self.groups = groups
+        members = [None] * len(groups)
+
+        def collect(g):
+            if members[g] is None:
+                channels = set(groups[g]['channels'])
+                for child in groups[g]['groups']:
+                    channels |= collect(child)
+                members[g] = channels
+            return members[g]
+
+        channel_groups = [[] for _ in range(channel_count)]
+        for g in range(len(groups)):
+            for i in collect(g):
+                channel_groups[i].append(g)
+        self.channel_groups = tuple((i, tuple(group_list)) for i, group_list in enumerate(channel_groups) if group_list)
+
+        count = len(groups)
+        self.currents = array('d', [0.0]) * count
+        self.powers = array('d', [0.0]) * count
+        self.energy = array('d', [0.0]) * count
+        self.last_current = array('d', [0.0]) * channel_count
+        self.last_power = array('d', [0.0]) * channel_count
+        self.last_energy = array('d', [0.0]) * channel_count
+        self.updates = 0
+        self.swept_at = float('-inf')
+
+    def update(self, result, energy=None):
+        """Apply one computed frame; returns the positions of the groups whose sums changed."""
+        if self.updates % AGGREGATION_RESYNC == 0:
+            for values in (self.currents, self.powers, self.energy, self.last_current, self.last_power,
+                           self.last_energy):
+                values[:] = array('d', [0.0]) * len(values)
+        self.updates += 1
+
+        currents, powers, total_energy = self.currents, self.powers, self.energy
+        last_current, last_power, last_energy = self.last_current, self.last_power, self.last_energy
+        changed = set()
+        for i, groups in self.channel_groups:
+            current = result.currents[i] if result.current_valid[i] else 0.0
+            power = result.powers[i] if result.power_valid[i] else 0.0
+            channel_energy = energy.channel_wh(i) if energy else 0.0
+            d_current = current - last_current[i]
+            d_power = power - last_power[i]
+            d_energy = channel_energy - last_energy[i]
+            if not (d_current or d_power or d_energy):
+                continue
+            last_current[i], last_power[i], last_energy[i] = current, power, channel_energy
+            for g in groups:
+                currents[g] += d_current
+                powers[g] += d_power
+                total_energy[g] += d_energy
+            changed.update(groups)
+        return changed
 
 class DeviceManager:
-    def __init__(self, channels):
+    def __init__(self, channels, value_cache, summary_unit_start=CHANNEL_COUNT * 2 + 1, publish_filter=None,
+                 energy=None, use_numpy=False, groups=None):
         self.channels = channels
+        self.summary_unit_start = summary_unit_start
+        self.publish_filter = publish_filter or PublishFilter({}, 0)
+        self.energy = energy
+        self.power_device_type = 'energy' if energy else 'power'
+        self.value_cache = value_cache
         self.devices = {}
         self.summary_devices = {}
         self.phase_groups = {}
         self.phase_labels = {}
         self.sorted_phases = []
         self._group_phases()
+        self.plan = ChannelPlan(channels, self.sorted_phases, use_numpy)
+        self.aggregation = AggregationTree(groups, len(channels)) if groups else None
         self._create_devices()
 
     def _group_phases(self):
@@ -300,36 +2194,46 @@ class DeviceManager:
     def _create_devices(self):
         # Individual devices
         for i, channel in enumerate(self.channels):
-            current_unit = i + 1
+            current_unit = channel['current_unit']
             current_name = f"{channel['name']} Current"
             self._create_device(current_unit, current_name, 'current')
             self.devices[current_unit] = {'name': current_name, 'type': 'current', 'channel_idx': i}
 
-            power_unit = i + 17
+            power_unit = channel['power_unit']
             power_name = f"{channel['name']} Power"
-            self._create_device(power_unit, power_name, 'power')
+            self._create_device(power_unit, power_name, self.power_device_type)
             self.devices[power_unit] = {'name': power_name, 'type': 'power', 'channel_idx': i}
 
+            if channel.get('switch_unit'):
+                self._create_device(channel['switch_unit'], f"{channel['name']} On", 'switch')
+
         # Summary devices
-        next_unit = CHANNEL_COUNT * 2 + 1
+        next_unit = self.summary_unit_start
         for phase_idx in self.sorted_phases:
             label = self.phase_labels[phase_idx]
             current_sum_unit = next_unit
             current_sum_name = f"Current Sum {label}"
             self._create_device(current_sum_unit, current_sum_name, 'current')
-            self.summary_devices[current_sum_unit] = {'type': 'current_sum', 'phase': phase_idx}
+            self.summary_devices[current_sum_unit] = {'type': 'current_sum', 'device_type': 'current', 'phase': phase_idx,
+                                                      'phase_pos': self.sorted_phases.index(phase_idx)}
             next_unit += 1
 
             power_sum_unit = next_unit
             power_sum_name = f"Power Sum {label}"
-            self._create_device(power_sum_unit, power_sum_name, 'power')
-            self.summary_devices[power_sum_unit] = {'type': 'power_sum', 'phase': phase_idx}
+            self._create_device(power_sum_unit, power_sum_name, self.power_device_type)
+            self.summary_devices[power_sum_unit] = {'type': 'power_sum', 'device_type': 'power', 'phase': phase_idx,
+                                                    'phase_pos': self.sorted_phases.index(phase_idx)}
             next_unit += 1
 
         total_power_unit = next_unit
         total_power_name = "Total Power Sum"
-        self._create_device(total_power_unit, total_power_name, 'power')
-        self.summary_devices[total_power_unit] = {'type': 'power_total'}
+        self._create_device(total_power_unit, total_power_name, self.power_device_type)
+        self.summary_devices[total_power_unit] = {'type': 'power_total', 'device_type': 'power'}
+
+        # Group devices
+        for group in self.aggregation.groups if self.aggregation else ():
+            self._create_device(group['current_unit'], f"{group['name']} Current", 'current')
+            self._create_device(group['power_unit'], f"{group['name']} Power", self.power_device_type)
 
     def _create_device(self, unit_id, name, device_type):
         if unit_id not in Devices:
@@ -344,96 +2248,575 @@ class DeviceManager:
                 Used=1
             ).Create()
 
+    def _publish(self, unit, device_type, value, now, energy_wh=None):
+        if unit not in Devices:
+            return False
+        if not self.publish_filter.should_publish(unit, device_type, value, now):
+            metrics.inc('hpm_device_updates_suppressed_total')
+            return False
+        metrics.inc('hpm_device_updates_total')
+        # Power devices created before energy was enabled are plain Usage devices
+        if energy_wh is not None and Devices[unit].Type == DEVICE_TYPES['energy']['type_id']:
+            Devices[unit].Update(nValue=0, sValue=f"{value:.2f};{energy_wh:.1f}")
+        else:
+            Devices[unit].Update(nValue=0, sValue=f"{value:.2f}")
+        return True
+
+    def compute_sample(self, current_values):
+        return self.plan.compute(current_values, self.value_cache.get_values())
+
     def update_devices(self, current_values):
-        phase_values = ValueFetcher.get_phase_values(self.channels, self.phase_groups)
-        phase_current_sums = {vidx: 0.0 for vidx in self.phase_groups}
-        phase_power_sums = {vidx: 0.0 for vidx in self.phase_groups}
-        total_power = 0.0
+        now = time.monotonic()
+        plan = self.plan
+        with metrics.timer('hpm_stage_seconds', stage='compute'):
+            result = plan.compute(current_values, self.value_cache.get_values())
+        publish_started = time.monotonic()
         updated_count = 0
 
-        # Calculate and update individual devices
-        for channel_idx in range(CHANNEL_COUNT):
-            if channel_idx >= len(current_values):
+        # Update individual devices
+        for channel_idx in range(plan.count):
+            if not result.present[channel_idx]:
                 continue
 
-            raw_current = current_values[channel_idx]
-            current_amperes = raw_current * CURRENT_MULTIPLIER
-            current_valid = 0 <= current_amperes <= MAX_CURRENT
-
-            current_unit = channel_idx + 1
-            if current_valid and current_unit in Devices:
-                Devices[current_unit].Update(nValue=0, sValue=f"{current_amperes:.2f}")
+            current_amperes = result.currents[channel_idx]
+            if result.current_valid[channel_idx] and \
+                    self._publish(plan.current_units[channel_idx], 'current', current_amperes, now):
                 updated_count += 1
                 if logger.debug_mode:
-                    logger.debug(f"Device '{self.channels[channel_idx]['name']} Current': Updated to {current_amperes:.2f}A")
+                    logger.debug("Device '%s Current': Updated to %.2fA", self.channels[channel_idx]['name'],
+                                 current_amperes)
 
-            channel_config = self.channels[channel_idx]
-            vidx = channel_config.get('voltage_idx')
-            power_watts = 0.0
-            power_valid = False
+            if plan.phase_of[channel_idx] < 0:
+                # Static channels have no phase; say so per channel at most every LOG_RATE_INTERVAL, not every cycle
+                logger.warning("Channel '%s' has no valid phase (voltage_idx: %s)", self.channels[channel_idx]['name'],
+                               self.channels[channel_idx].get('voltage_idx'), key=('no_phase', channel_idx))
+                continue
 
-            if vidx in phase_values:
-                voltage = phase_values[vidx]['voltage']
-                pf = phase_values[vidx]['pf']
-                power_watts = voltage * current_amperes * pf
-                power_valid = 0 <= power_watts <= MAX_POWER
+            power_watts = result.powers[channel_idx]
+            if logger.debug_mode:
+                logger.debug("Channel '%s': %sV × %.3fA × %s = %.1fW", self.channels[channel_idx]['name'],
+                             result.voltages[channel_idx], current_amperes, result.pfs[channel_idx], power_watts)
 
+            energy_wh = self.energy.channel_wh(channel_idx) if self.energy else None
+            if result.power_valid[channel_idx] and \
+                    self._publish(plan.power_units[channel_idx], 'power', power_watts, now, energy_wh):
+                updated_count += 1
                 if logger.debug_mode:
-                    logger.debug(f"Channel '{channel_config['name']}': {voltage}V × {current_amperes:.3f}A × {pf} = {power_watts:.1f}W")
-
-                power_unit = channel_idx + 17
-                if power_valid and power_unit in Devices:
-                    Devices[power_unit].Update(nValue=0, sValue=f"{power_watts:.2f}")
-                    updated_count += 1
-                    if logger.debug_mode:
-                        logger.debug(f"Device '{self.channels[channel_idx]['name']} Power': Updated to {power_watts:.1f}W")
-
-                if current_valid:
-                    phase_current_sums[vidx] += current_amperes
-                if power_valid:
-                    phase_power_sums[vidx] += power_watts
-                    total_power += power_watts
-            else:
-                logger.warning(f"Channel '{channel_config['name']}' has no valid phase (voltage_idx: {vidx})")
+                    logger.debug("Device '%s Power': Updated to %.1fW", self.channels[channel_idx]['name'], power_watts)
 
         # Update summary devices
         for unit, info in self.summary_devices.items():
+            energy_wh = None
             if info['type'] == 'current_sum':
-                val = phase_current_sums.get(info['phase'], 0.0)
-                svalue = f"{val:.2f}"
-                log_msg = f"Current Sum {self.phase_labels[info['phase']]} to {val:.2f}A"
+                val = result.phase_currents[info['phase_pos']]
             elif info['type'] == 'power_sum':
-                val = phase_power_sums.get(info['phase'], 0.0)
-                svalue = f"{val:.2f}"
-                log_msg = f"Power Sum {self.phase_labels[info['phase']]} to {val:.2f}W"
+                val = result.phase_powers[info['phase_pos']]
+                if self.energy:
+                    energy_wh = self.energy.phase_wh(info['phase'])
             elif info['type'] == 'power_total':
-                val = total_power
-                svalue = f"{val:.2f}"
-                log_msg = f"Total Power Sum to {val:.2f}W"
+                val = result.total_power
+                if self.energy:
+                    energy_wh = self.energy.total_wh()
             else:
                 continue
 
-            if unit in Devices:
-                Devices[unit].Update(nValue=0, sValue=svalue)
-                if logger.debug_mode:
-                    logger.debug(f"Updated {log_msg}")
+            if self._publish(unit, info['device_type'], val, now, energy_wh) and logger.debug_mode:
+                logger.debug("Updated %s to %.2f%s", Devices[unit].Name, val,
+                             'A' if info['device_type'] == 'current' else 'W')
+
+        if self.aggregation:
+            self._publish_groups(result, now)
 
         # Verify consistency
-        sum_phases = sum(phase_power_sums.values())
-        if abs(sum_phases - total_power) > 0.01:
-            logger.warning(f"Power sum mismatch: L1+L2+L3={sum_phases:.2f}W, Total={total_power:.2f}W")
-            for vidx in phase_power_sums:
-                logger.debug(f"Phase {self.phase_labels[vidx]} power: {phase_power_sums[vidx]:.2f}W")
+        sum_phases = sum(result.phase_powers)
+        if abs(sum_phases - result.total_power) > 0.01:
+            logger.warning("Power sum mismatch: phases=%.2fW, Total=%.2fW", sum_phases, result.total_power)
+            for pos, vidx in enumerate(plan.phases):
+                logger.debug("Phase %s power: %.2fW", self.phase_labels[vidx], result.phase_powers[pos])
+
+        metrics.observe('hpm_stage_seconds', time.monotonic() - publish_started, stage='publish')
+        if logger.debug_mode:
+            logger.debug("Updated %d/%d individual devices, publish totals: %s",
+                         updated_count, len(self.devices), self.publish_filter.summary())
+
+    def _publish_groups(self, result, now):
+        tree = self.aggregation
+        changed = tree.update(result, self.energy)
+        if now - tree.swept_at >= self.publish_filter.refresh_interval:
+            # Unchanged sums are only republished often enough for Domoticz not to mark them timed out
+            changed = range(len(tree.groups))
+            tree.swept_at = now
+
+        for g in changed:
+            group = tree.groups[g]
+            # Sums of non-negative values; clamp the rounding residue of incremental updates
+            self._publish(group['current_unit'], 'current', max(0.0, tree.currents[g]), now)
+            self._publish(group['power_unit'], 'power', max(0.0, tree.powers[g]), now,
+                          tree.energy[g] if self.energy else None)
+        if changed and logger.debug_mode:
+            logger.debug("Groups: %s", ', '.join(f"{tree.groups[g]['name']} {tree.powers[g]:.1f}W" for g in changed))
+
+    def create_diagnostic_devices(self):
+        self._create_device(DIAGNOSTIC_UNITS['heartbeat_ms'], "HPM Heartbeat Time", 'duration')
+        self._create_device(DIAGNOSTIC_UNITS['modbus_read_ms'], "HPM Modbus Read Time", 'duration')
+        self._create_device(DIAGNOSTIC_UNITS['modbus_failures'], "HPM Modbus Failures", 'count')
+
+    def update_diagnostic_devices(self, heartbeat_seconds):
+        values = {
+            'heartbeat_ms': heartbeat_seconds * 1000,
+            'modbus_read_ms': metrics.quantile('hpm_modbus_read_seconds', 0.5) * 1000,
+            'modbus_failures': metrics.get('hpm_modbus_failures_total')
+        }
+        for name, value in values.items():
+            unit = DIAGNOSTIC_UNITS[name]
+            if unit in Devices:
+                Devices[unit].Update(nValue=0, sValue=f"{value:.2f}")
+
+class HistoryStore:
+    """Local per-channel current/power history in SQLite (WAL mode)."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS channels (unit INTEGER PRIMARY KEY, name TEXT)",
+        "CREATE TABLE IF NOT EXISTS samples (ts REAL NOT NULL, unit INTEGER NOT NULL, current REAL, power REAL)",
+        "CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)",
+        "CREATE TABLE IF NOT EXISTS rollup_minute (ts INTEGER NOT NULL, unit INTEGER NOT NULL, "
+        "current_avg REAL, current_min REAL, current_max REAL, power_avg REAL, power_max REAL, samples INTEGER, "
+        "PRIMARY KEY (ts, unit))",
+        "CREATE TABLE IF NOT EXISTS rollup_hour (ts INTEGER NOT NULL, unit INTEGER NOT NULL, "
+        "current_avg REAL, current_min REAL, current_max REAL, power_avg REAL, power_max REAL, samples INTEGER, "
+        "PRIMARY KEY (ts, unit))",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)",
+    )
+
+    def __init__(self, path, channels, batch_size, retention_days):
+        self.path = path
+        self.channels = [(channel['current_unit'], channel['name']) for channel in channels]
+        self.batch_size = batch_size
+        self.retention = {tier: days * 86400 for tier, days in retention_days.items()}
+        self.pending = collections.deque(maxlen=HISTORY_MAX_PENDING)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.db = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="HPM-History", daemon=True)
+        self.thread.start()
+        logger.info("Recording channel history to %s", self.path)
+
+    def add(self, timestamp, result, fresh=None):
+        rows = [(timestamp, unit, result.currents[i] if result.current_valid[i] else None,
+                 result.powers[i] if result.power_valid[i] else None)
+                for i, (unit, _) in enumerate(self.channels) if result.present[i] and (fresh is None or fresh[i])]
+        with self.lock:
+            self.pending.append(rows)
+            ready = len(self.pending) >= self.batch_size
+        if ready:
+            self.wakeup.set()
+
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def _run(self):
+        try:
+            self.db = sqlite3.connect(self.path)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            with self.db:
+                for statement in self.SCHEMA:
+                    self.db.execute(statement)
+                self.db.executemany("INSERT OR REPLACE INTO channels (unit, name) VALUES (?, ?)", self.channels)
+        except sqlite3.Error as e:
+            logger.error("History store %s unavailable: %s", self.path, e)
+            return
+
+        last_rollup = time.monotonic()
+        while not self.stop_event.is_set():
+            self.wakeup.wait(HISTORY_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self._flush()
+            if time.monotonic() - last_rollup >= HISTORY_ROLLUP_INTERVAL:
+                self._rollup()
+                last_rollup = time.monotonic()
+
+        self._flush()
+        self._rollup()
+        self.db.close()
+
+    def _flush(self):
+        with self.lock:
+            batches = list(self.pending)
+            self.pending.clear()
+        if not batches:
+            return
+        try:
+            with metrics.timer('hpm_history_write_seconds'), self.db:
+                for rows in batches:
+                    self.db.executemany("INSERT INTO samples (ts, unit, current, power) VALUES (?, ?, ?, ?)", rows)
+            metrics.inc('hpm_history_samples_total', len(batches))
+        except sqlite3.Error as e:
+            logger.error("History write failed: %s", e)
+
+    def _rollup(self):
+        now = time.time()
+        try:
+            with self.db:
+                minute_end = int(now // 60) * 60
+                minute_start = self._watermark('minute')
+                self.db.execute(
+                    "INSERT OR REPLACE INTO rollup_minute "
+                    "SELECT CAST(ts / 60 AS INTEGER) * 60 AS bucket, unit, AVG(current), MIN(current), MAX(current), "
+                    "AVG(power), MAX(power), COUNT(*) FROM samples WHERE ts >= ? AND ts < ? GROUP BY bucket, unit",
+                    (minute_start, minute_end))
+                self._set_watermark('minute', minute_end)
+
+                hour_end = int(now // 3600) * 3600
+                hour_start = self._watermark('hour')
+                self.db.execute(
+                    "INSERT OR REPLACE INTO rollup_hour "
+                    "SELECT (ts / 3600) * 3600 AS bucket, unit, SUM(current_avg * samples) / SUM(samples), "
+                    "MIN(current_min), MAX(current_max), SUM(power_avg * samples) / SUM(samples), MAX(power_max), "
+                    "SUM(samples) FROM rollup_minute WHERE ts >= ? AND ts < ? GROUP BY bucket, unit",
+                    (hour_start, hour_end))
+                self._set_watermark('hour', hour_end)
+
+                self.db.execute("DELETE FROM samples WHERE ts < ?", (now - self.retention['raw'],))
+                self.db.execute("DELETE FROM rollup_minute WHERE ts < ?", (now - self.retention['minute'],))
+                self.db.execute("DELETE FROM rollup_hour WHERE ts < ?", (now - self.retention['hour'],))
+        except sqlite3.Error as e:
+            logger.error("History rollup failed: %s", e)
+
+    def _watermark(self, tier):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (f"rollup_{tier}",)).fetchone()
+        return row[0] if row else 0
+
+    def _set_watermark(self, tier, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"rollup_{tier}", value))
+
+class CaptureWriter:
+    """Appends register frames and the voltage/PF values in use to a binary capture file."""
+
+    def __init__(self, path, channels, idxs, summary_unit_start, max_bytes):
+        self.path = path
+        self.idxs = list(idxs)
+        self.channel_count = len(channels)
+        self.bitmap_size = (self.channel_count + 7) // 8
+        self.record = CaptureWriter.record_format(self.channel_count, len(self.idxs))
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.full = False
+
+        config = json.dumps({
+            'channels': [{key: channel.get(key) for key in CAPTURE_CHANNEL_KEYS} for channel in channels],
+            'idxs': self.idxs,
+            'summary_unit_start': summary_unit_start
+        }).encode('utf-8')
+        header = CAPTURE_HEADER.pack(CAPTURE_FILE_MAGIC, CAPTURE_FILE_VERSION, self.channel_count,
+                                     len(self.idxs), len(config)) + config
+        self.file = self._open(header)
+        self.size = self.file.tell()
+        self.last_flush = time.monotonic()
+        logger.info("Capturing register frames to %s (%d bytes per frame)", path, self.record.size)
+
+    @staticmethod
+    def record_format(channel_count, idx_count):
+        return struct.Struct(f'<d{(channel_count + 7) // 8}s{channel_count}H{idx_count}d')
+
+    def _open(self, header):
+        try:
+            with open(self.path, 'rb') as existing:
+                same_config = existing.read(len(header)) == header
+        except FileNotFoundError:
+            same_config = None
+
+        if same_config:
+            capture = open(self.path, 'r+b')
+            # Drop a record cut short by a crash so the file stays a whole number of records
+            size = os.fstat(capture.fileno()).st_size
+            capture.truncate(len(header) + (size - len(header)) // self.record.size * self.record.size)
+            capture.seek(0, os.SEEK_END)
+            return capture
+
+        if same_config is False:
+            os.replace(self.path, self.path + '.1')
+            logger.warning("Capture %s was recorded with a different configuration, moved it to %s.1",
+                           self.path, self.path)
+        capture = open(self.path, 'wb')
+        capture.write(header)
+        return capture
+
+    def add(self, frame, values):
+        registers = frame.registers
+        missing = bytearray(self.bitmap_size)
+        if None in registers:
+            registers = list(registers)
+            for i, value in enumerate(registers):
+                if value is None:
+                    registers[i] = 0
+                    missing[i >> 3] |= 1 << (i & 7)
+        data = self.record.pack(frame.timestamp, bytes(missing), *registers,
+                                *[values.get(idx, float('nan')) for idx in self.idxs])
+
+        with self.lock:
+            if self.full:
+                return
+            if self.size + len(data) > self.max_bytes:
+                self.full = True
+                logger.warning("Capture %s reached %d bytes, recording stopped", self.path, self.size)
+                return
+            self.file.write(data)
+            self.size += len(data)
+            if time.monotonic() - self.last_flush >= CAPTURE_FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+        metrics.inc('hpm_capture_frames_total')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class CaptureReader:
+    """Memory-mapped view of a capture file, decoded one record at a time."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as capture:
+            self.map = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.map) < CAPTURE_HEADER.size:
+            raise ValueError(f"{path} is not an HPM capture file")
+        magic, version, channel_count, idx_count, config_size = CAPTURE_HEADER.unpack_from(self.map, 0)
+        if magic != CAPTURE_FILE_MAGIC or version != CAPTURE_FILE_VERSION:
+            raise ValueError(f"{path} is not an HPM capture file (version {CAPTURE_FILE_VERSION})")
+
+        config = json.loads(self.map[CAPTURE_HEADER.size:CAPTURE_HEADER.size + config_size].decode('utf-8'))
+        self.channels = config['channels']
+        self.idxs = config['idxs']
+        # Captures written before the summary start was recorded: derive it from the channel units
+        self.summary_unit_start = config.get('summary_unit_start') or (
+            SUMMARY_UNIT_START if any(channel['power_unit'] > CHANNEL_COUNT * 2 for channel in self.channels)
+            else CHANNEL_COUNT * 2 + 1)
+        self.channel_count = channel_count
+        self.record = CaptureWriter.record_format(channel_count, idx_count)
+        self.offset = CAPTURE_HEADER.size + config_size
+        self.count = (len(self.map) - self.offset) // self.record.size
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        count, idxs = self.channel_count, self.idxs
+        end = self.offset + self.count * self.record.size
+        for fields in self.record.iter_unpack(memoryview(self.map)[self.offset:end]):
+            registers = list(fields[2:2 + count])
+            missing = fields[1]
+            if any(missing):
+                for i in range(count):
+                    if missing[i >> 3] >> (i & 7) & 1:
+                        registers[i] = None
+            values = {idx: value for idx, value in zip(idxs, fields[2 + count:]) if value == value}
+            yield fields[0], registers, values
+
+    def close(self):
+        self.map.close()
+
+class LatencyTracker:
+    """Rolling window of read latencies for before/after comparisons."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return "no reads"
+        ordered = sorted(self.samples)
+        mean = sum(ordered) / len(ordered)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return (f"mean {mean * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms, max {ordered[-1] * 1000:.1f}ms "
+                f"over last {len(ordered)} of {self.count} reads")
+
+class ModbusRTUClient:
+    """Native Modbus RTU master on a local serial port (e.g. a USB-RS485 adapter)."""
+
+    CRC_TABLE = None
+
+    def __init__(self, device, baudrate=9600, parity='N', stopbits=1, unit_id=1, timeout=MODBUS_TIMEOUT):
+        self.device = device
+        self.baudrate = baudrate
+        self.parity = parity
+        self.stopbits = stopbits
+        self.unit_id = unit_id
+        self.timeout = timeout
+        self.fd = None
+        self.last_error = 0
+        self.last_except = 0
+        self.last_error_as_txt = ""
+        bits_per_char = 1 + 8 + (0 if parity == 'N' else 1) + stopbits
+        # Above 19200 baud the spec fixes the inter-frame gap at 1.75ms
+        self.frame_gap = 3.5 * bits_per_char / baudrate if baudrate <= 19200 else 0.00175
+        self.char_time = bits_per_char / baudrate
+        self.bus_idle_at = 0
+
+    @staticmethod
+    def _crc_table():
+        table = []
+        for byte in range(256):
+            crc = byte
+            for _ in range(8):
+                crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+            table.append(crc)
+        return array('H', table)
 
-        logger.debug(f"Updated {updated_count}/{len(self.devices)} individual devices")
+    @staticmethod
+    def crc16(data):
+        crc = 0xFFFF
+        table = ModbusRTUClient.CRC_TABLE
+        if table is None:
+            table = ModbusRTUClient.CRC_TABLE = ModbusRTUClient._crc_table()
+        for byte in data:
+            crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+        return crc
+
+    @property
+    def is_open(self):
+        return self.fd is not None
+
+    def open(self):
+        if self.fd is not None:
+            return True
+        if termios is None:
+            raise OSError("serial ports need a POSIX system (termios)")
+        fd = os.open(self.device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(fd)
+            iflag = 0
+            oflag = 0
+            lflag = 0
+            cflag = termios.CS8 | termios.CREAD | termios.CLOCAL
+            if self.parity != 'N':
+                cflag |= termios.PARENB | (termios.PARODD if self.parity == 'O' else 0)
+            if self.stopbits == 2:
+                cflag |= termios.CSTOPB
+            speed = getattr(termios, f"B{self.baudrate}")
+            cc[termios.VMIN] = 0
+            cc[termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+            termios.tcflush(fd, termios.TCIOFLUSH)
+        except (termios.error, OSError):
+            os.close(fd)
+            raise
+        self.fd = fd
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def read_holding_registers(self, address, count):
+        return self._read_words(3, address, count)
+
+    def read_input_registers(self, address, count):
+        return self._read_words(4, address, count)
+
+    def _read_words(self, function_code, address, count):
+        self.last_error = 0
+        self.last_except = 0
+        self.last_error_as_txt = ""
+        try:
+            self.open()
+            request = struct.pack('>BBHH', self.unit_id, function_code, address, count)
+            self._send(request + struct.pack('<H', self.crc16(request)))
+
+            header = self._recv(3)
+            if header[0] != self.unit_id or header[1] & 0x7F != function_code:
+                raise ValueError(f"unexpected response header {header.hex()}")
+            if header[1] & 0x80:
+                frame = header + self._recv(2)
+                self._check_crc(frame)
+                self.last_except = header[2]
+                return self._fail(f"exception {header[2]}")
+            if header[2] != count * 2:
+                raise ValueError(f"unexpected byte count {header[2]}")
+            frame = header + self._recv(count * 2 + 2)
+            self._check_crc(frame)
+            return list(struct.unpack(f'>{count}H', frame[3:-2]))
+        except (OSError, ValueError, TimeoutError) as e:
+            # Drop the rest of a broken frame so the next request starts clean
+            self._drain()
+            return self._fail(str(e))
+
+    def _send(self, frame):
+        silence = self.bus_idle_at + self.frame_gap - time.monotonic()
+        if silence > 0:
+            time.sleep(silence)
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+        os.write(self.fd, frame)
+        termios.tcdrain(self.fd)
+
+    def _recv(self, size):
+        deadline = time.monotonic() + self.timeout
+        data = b''
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("timeout waiting for response")
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if readable:
+                chunk = os.read(self.fd, size - len(data))
+                if not chunk:
+                    raise OSError("serial port closed")
+                data += chunk
+        self.bus_idle_at = time.monotonic()
+        return data
+
+    def _check_crc(self, frame):
+        if struct.unpack('<H', frame[-2:])[0] != self.crc16(frame[:-2]):
+            raise ValueError("CRC mismatch")
+
+    def _drain(self):
+        if self.fd is None:
+            return
+        try:
+            while select.select([self.fd], [], [], self.frame_gap)[0] and os.read(self.fd, 256):
+                pass
+        except OSError:
+            self.close()
+        self.bus_idle_at = time.monotonic()
+
+    def _fail(self, message):
+        self.last_error = 1
+        self.last_error_as_txt = message
+        return None
 
 class ModbusManager:
-    def __init__(self, connection_params):
+    def __init__(self, connection_params, session='per_read', backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
         self.connection_params = connection_params
+        self.persistent = session == 'persistent'
         self.client = None
         self.health = ConnectionHealthMonitor()
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.backoff = {}
+        self.range_rejected = False
+        self.read_latency = LatencyTracker()
+        self.last_activity = 0
+        self.sessions_opened = 0
 
     def connect(self):
+        if self.connection_params.get('transport') == 'rtu':
+            return self._connect_rtu()
         if ModbusClient is None:
             logger.error("pyModbusTCP library not available")
             return False
@@ -444,36 +2827,147 @@ class ModbusManager:
                 port=self.connection_params['port'],
                 unit_id=self.connection_params['unit_id'],
                 auto_open=True,
-                auto_close=True,
-                timeout=2
+                auto_close=not self.persistent,
+                timeout=MODBUS_TIMEOUT
             )
-            logger.info(f"Connected to {self.connection_params['host']}:{self.connection_params['port']}")
+            if self.persistent:
+                self._ensure_session()
+            logger.info("Connected to %s:%s%s", self.connection_params['host'], self.connection_params['port'],
+                        " (persistent session)" if self.persistent else "")
             return True
         except Exception as e:
-            logger.error(f"Connection failed: {e}")
+            logger.error("Connection failed: %s", e)
             return False
 
-    def read_channels(self):
+    def _connect_rtu(self):
+        params = self.connection_params
+        self.persistent = False  # the serial port stays open; TCP session handling does not apply
+        self.client = ModbusRTUClient(params['serial_port'], params['baudrate'], params['parity'], params['stopbits'],
+                                      unit_id=params['unit_id'])
+        try:
+            self.client.open()
+            logger.info("Opened %s at %d 8%s%d (Modbus RTU)", params['serial_port'], params['baudrate'],
+                        params['parity'], params['stopbits'])
+        except OSError as e:
+            # Like a TCP gateway that is down, the port is retried on every read
+            logger.error("Opening %s failed: %s", params['serial_port'], e)
+        return True
+
+    def backoff_failures(self):
+        return {unit_id: backoff.failures for unit_id, backoff in self.backoff.items() if backoff.failures}
+
+    def restore_backoff(self, failures):
+        """Carry consecutive failures over a restart; the next failure then backs off as before the restart."""
+        for unit_id, count in failures.items():
+            backoff = self.backoff[unit_id] = RetryBackoff(self.backoff_base, self.backoff_max)
+            backoff.failures = count
+
+    def read_channels(self, unit_id=None):
+        return self.read_block(unit_id or self.connection_params['unit_id'], CURRENT_REGISTER_START, CHANNEL_COUNT)
+
+    def read_block(self, unit_id, address, count, function='holding'):
+        """Read count consecutive registers from one unit; None on failure or while backing off."""
+        self.range_rejected = False
         if not self.client:
             return None
 
+        backoff = self.backoff.get(unit_id)
+        if backoff is None:
+            backoff = self.backoff[unit_id] = RetryBackoff(self.backoff_base, self.backoff_max)
+        if not backoff.ready():
+            return None
+
         try:
-            registers = self.client.read_holding_registers(CURRENT_REGISTER_START, CHANNEL_COUNT)
+            started = time.monotonic()
+            self.client.unit_id = unit_id
+            registers = self._read_registers(address, count, function)
 
-            if registers and len(registers) == CHANNEL_COUNT:
+            if registers and len(registers) == count:
+                self.read_latency.record(time.monotonic() - started)
+                metrics.observe('hpm_modbus_read_seconds', time.monotonic() - started)
                 self.health.record_success()
-                logger.debug(f"Read {len(registers)} registers: {registers}")
+                backoff.success()
+                logger.debug("Read %d registers at %d from ID %d: %s", count, address, unit_id, registers)
+                if self.read_latency.count % LATENCY_WINDOW == 0:
+                    logger.debug("Modbus read latency: %s", self.read_latency.summary())
                 return registers
+            elif self.client.last_except == EXP_DATA_ADDRESS:
+                # The unit answered but refused the range: not a connection problem, no backoff
+                self.range_rejected = True
+                metrics.inc('hpm_modbus_exceptions_total')
+                logger.error("ID %d rejected registers %d-%d as an illegal data address", unit_id, address,
+                             address + count - 1, key=('rejected', unit_id, address))
+                return None
             else:
                 self.health.record_failure()
-                logger.error("Failed to read registers")
+                delay = backoff.failure()
+                logger.error("Failed to read registers from ID %d, retrying in %.1fs", unit_id, delay,
+                             key=('read_failed', unit_id))
                 return None
 
         except Exception as e:
             self.health.record_failure()
-            logger.error(f"Read error: {e}")
+            delay = backoff.failure()
+            logger.error("Read error: %s, retrying in %.1fs", e, delay, key=('read_error', unit_id))
             return None
 
+    def _read_registers(self, address, count, function):
+        read = self.client.read_input_registers if function == 'input' else self.client.read_holding_registers
+        if not self.persistent:
+            return read(address, count)
+
+        fresh = self._ensure_session()
+        registers = read(address, count)
+        # A stale socket fails on send/recv; some gateways also drop the first
+        # frame after a fresh connect. Either way, retry once on a new session.
+        stale = self.client.last_error in (MB_SEND_ERR, MB_RECV_ERR, MB_SOCK_CLOSE_ERR)
+        if registers is None and (stale or (fresh and self.client.last_error == MB_TIMEOUT_ERR)):
+            logger.debug("Session read failed (%s), reconnecting", self.client.last_error_as_txt)
+            self.client.close()
+            self._ensure_session()
+            registers = read(address, count)
+        self.last_activity = time.monotonic()
+        return registers
+
+    def _ensure_session(self):
+        """Make sure the persistent socket is open and alive; returns True if it was (re)opened."""
+        if self.client.is_open:
+            if time.monotonic() - self.last_activity < SESSION_PROBE_IDLE or self._session_alive():
+                return False
+            logger.debug("Persistent session found half-open, reconnecting")
+            self.client.close()
+
+        if not self.client.open():
+            return False
+        self.sessions_opened += 1
+        self.last_activity = time.monotonic()
+        sock = self._socket()
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+        return True
+
+    def _session_alive(self):
+        # Liveness probe without bus traffic: an idle Modbus socket must have
+        # nothing to read, so readability means EOF, RST or stray data.
+        sock = self._socket()
+        if sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return True
+            return bool(sock.recv(1, socket.MSG_PEEK))
+        except (OSError, ValueError):
+            return False
+
+    def _socket(self):
+        # pyModbusTCP does not expose its socket publicly
+        return getattr(self.client, '_sock', None) or getattr(self.client, '_ModbusClient__sock', None)
+
     def check_connection(self):
         if self.health.should_reset_connection():
             logger.warning("Resetting connection due to failures")
@@ -489,12 +2983,592 @@ class ModbusManager:
             except:
                 pass
 
+ReadBlock = collections.namedtuple('ReadBlock', ['gateway', 'unit_id', 'function', 'address', 'count', 'fields'])
+
+class ReadPlanner:
+    """Coalesces register reads into as few Modbus requests as possible."""
+
+    @staticmethod
+    def plan(fields, max_gap=REGISTER_MAX_GAP, max_count=MODBUS_MAX_REGISTERS):
+        groups = {}
+        for field in fields:
+            groups.setdefault((field['gateway'], field['unit_id'], field['function']), []).append(field)
+
+        blocks = []
+        for (gateway, unit_id, function), group in groups.items():
+            group.sort(key=lambda f: f['address'])
+            start = end = None
+            members = []
+            for field in group:
+                field_end = field['address'] + field['width']
+                if members and field['address'] - end <= max_gap and max(end, field_end) - start <= max_count:
+                    end = max(end, field_end)
+                else:
+                    if members:
+                        blocks.append(ReadPlanner._block(gateway, unit_id, function, start, end, members))
+                    start, end, members = field['address'], field_end, []
+                members.append(field)
+            blocks.append(ReadPlanner._block(gateway, unit_id, function, start, end, members))
+        return blocks
+
+    @staticmethod
+    def _block(gateway, unit_id, function, start, end, members):
+        return ReadBlock(gateway, unit_id, function, start, end - start,
+                         tuple((field, field['address'] - start) for field in members))
+
+    @staticmethod
+    def decode(words, offset, register):
+        """Typed value of a register map entry from a block's raw 16-bit words."""
+        width, signed = REGISTER_TYPES[register['type']]
+        if width == 1:
+            raw = words[offset]
+            if signed and raw >= 0x8000:
+                raw -= 0x10000
+            return raw * register['scale']
+
+        high, low = words[offset], words[offset + 1]
+        if register['word_order'] == 'little':
+            high, low = low, high
+        if register['type'] == 'f32':
+            raw = struct.unpack('>f', struct.pack('>HH', high, low))[0]
+        else:
+            raw = high << 16 | low
+            if signed and raw >= 0x80000000:
+                raw -= 0x100000000
+        return raw * register['scale']
+
+class ModulePoller:
+    """Reads all configured modules into one flat list of channel registers."""
+
+    def __init__(self, modules, connection_params, session='per_read', strategy='sequential', bus_budget=1.0,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, registers=None, register_gap=REGISTER_MAX_GAP,
+                 on_registers=None, register_cache=None):
+        self.modules = modules
+        self.strategy = strategy
+        self.bus_budget = bus_budget
+        self.channel_count = len(modules) * CHANNEL_COUNT
+        self.last_values = [None] * self.channel_count
+        # Channels actually read this cycle under round_robin (None: all of them)
+        self.fresh = None
+        self.next_device = 0
+        self.executor = None
+        self.on_registers = on_registers
+        self.register_cache = register_cache
+
+        self.gateways = {}
+        fields = []
+        for module in modules:
+            module['gateway'] = self._gateway(connection_params, module, session, backoff_base, backoff_max)
+            fields.append({'gateway': module['gateway'], 'unit_id': module['unit_id'], 'function': 'holding',
+                           'address': CURRENT_REGISTER_START, 'width': CHANNEL_COUNT, 'module': module})
+        for register in registers or []:
+            fields.append(dict(register, gateway=self._gateway(connection_params, register, session,
+                                                                backoff_base, backoff_max)))
+
+        # One device per Modbus unit; round robin and concurrent reads work per device
+        self.blocks = ReadPlanner.plan(fields, register_gap)
+        devices = {}
+        for block in self.blocks:
+            devices.setdefault((block.gateway, block.unit_id), []).append(block)
+        self.devices = list(devices.values())
+        if registers:
+            logger.info("Register plan: %d register groups in %d Modbus request(s) per cycle",
+                        len(fields), len(self.blocks))
+
+    def _gateway(self, connection_params, device, session, backoff_base, backoff_max):
+        key = (device['host'], device['port'])
+        if key not in self.gateways:
+            params = dict(connection_params, host=device['host'], port=device['port'], unit_id=device['unit_id'])
+            self.gateways[key] = ModbusManager(params, session=session,
+                                               backoff_base=backoff_base, backoff_max=backoff_max)
+        return key
+
+    def connect(self):
+        connected = [manager.connect() for manager in self.gateways.values()]
+        if self.strategy == 'concurrent' and len(self.gateways) > 1:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(self.gateways), thread_name_prefix="HPM-Gateway"
+            )
+        return any(connected)
+
+    def read_all(self):
+        register_values = {}
+        if self.strategy == 'round_robin':
+            self._read_round_robin(register_values)
+        elif self.executor:
+            by_gateway = {}
+            for device in self.devices:
+                by_gateway.setdefault(device[0].gateway, []).append(device)
+            futures = [self.executor.submit(self._read_devices, group) for group in by_gateway.values()]
+            for future in concurrent.futures.as_completed(futures):
+                register_values.update(future.result())
+        else:
+            register_values = self._read_devices(self.devices)
+
+        if register_values and self.on_registers:
+            self.on_registers(register_values)
+        if all(value is None for value in self.last_values):
+            return None
+        return list(self.last_values)
+
+    def _read_round_robin(self, register_values):
+        started = time.monotonic()
+        self.fresh = bytearray(self.channel_count)
+        for _ in range(len(self.devices)):
+            device = self.devices[self.next_device]
+            self.next_device = (self.next_device + 1) % len(self.devices)
+            register_values.update(self._read_devices([device]))
+            if time.monotonic() - started >= self.bus_budget:
+                break
+
+    def _read_devices(self, devices):
+        register_values = {}
+        for device in devices:
+            i = 0
+            while i < len(device):
+                block = device[i]
+                manager = self.gateways[block.gateway]
+                words, rejected = None, False
+                if manager.check_connection():
+                    words = manager.read_block(block.unit_id, block.address, block.count, block.function)
+                    rejected = manager.range_rejected
+                split = ReadPlanner.plan([field for field, _ in block.fields], max_gap=-1) \
+                    if words is None and rejected and len(block.fields) > 1 else ()
+                if len(split) > 1:
+                    # Some devices refuse reads spanning unmapped registers: stop bridging gaps in this block
+                    device[i:i + 1] = split
+                    logger.warning("ID %d refused a coalesced read at %d-%d, reading its registers separately",
+                                   block.unit_id, block.address, block.address + block.count - 1)
+                    continue
+                i += 1
+                if words and self.register_cache:
+                    self.register_cache.store(block.unit_id, block.function, block.address, words)
+                for field, offset in block.fields:
+                    module = field.get('module')
+                    if module is not None:
+                        first = module['first_channel']
+                        self.last_values[first:first + CHANNEL_COUNT] = \
+                            words[offset:offset + CHANNEL_COUNT] if words else [None] * CHANNEL_COUNT
+                        if self.fresh is not None:
+                            self.fresh[first:first + CHANNEL_COUNT] = b'\x01' * CHANNEL_COUNT
+                    elif words:
+                        register_values[field['name']] = ReadPlanner.decode(words, offset, field)
+        return register_values
+
+    def disconnect(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for manager in self.gateways.values():
+            manager.disconnect()
+
+    def health_state(self):
+        return {f"{host}:{port}": manager.backoff_failures() for (host, port), manager in self.gateways.items()}
+
+    def restore_health(self, state):
+        for (host, port), manager in self.gateways.items():
+            failures = state.get(f"{host}:{port}") or {}
+            manager.restore_backoff({int(unit_id): count for unit_id, count in failures.items()})
+
+    def latency_summary(self):
+        return '; '.join(f"{host}:{port} {manager.read_latency.summary()}"
+                         for (host, port), manager in self.gateways.items())
+
+class RegisterCache:
+    """Most recent value of every register the plugin has read, per Modbus ID and function."""
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def store(self, unit_id, function, address, words):
+        now = time.monotonic()
+        with self.lock:
+            table = self.tables.setdefault((unit_id, function), {})
+            for offset, word in enumerate(words):
+                table[address + offset] = (word, now)
+
+    def lookup(self, unit_id, function, address, count):
+        """Return (words, None) or (None, Modbus exception code)."""
+        oldest = time.monotonic() - self.max_age
+        with self.lock:
+            table = self.tables.get((unit_id, function))
+            if table is None:
+                return None, EXP_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND
+            words = []
+            for register in range(address, address + count):
+                entry = table.get(register)
+                if entry is None:
+                    return None, EXP_DATA_ADDRESS
+                if entry[1] < oldest:
+                    return None, EXP_GATEWAY_TARGET_DEVICE_FAILED_TO_RESPOND
+                words.append(entry[0])
+        return words, None
+
+if ModbusServer is not None:
+    class CachedDataHandler(DataHandler):
+        """Serves register reads from the RegisterCache; everything else is refused."""
+
+        def __init__(self, cache):
+            super().__init__()
+            self.cache = cache
+
+        def read_h_regs(self, address, count, srv_info):
+            return self._read(srv_info.recv_frame.mbap.unit_id, 'holding', address, count)
+
+        def read_i_regs(self, address, count, srv_info):
+            return self._read(srv_info.recv_frame.mbap.unit_id, 'input', address, count)
+
+        def _read(self, unit_id, function, address, count):
+            words, exception = self.cache.lookup(unit_id, function, address, count)
+            metrics.inc('hpm_fanout_requests_total', result='hit' if exception is None else 'miss')
+            if exception is not None:
+                return DataHandler.Return(exp_code=exception)
+            return DataHandler.Return(exp_code=0, data=words)
+
+        def read_coils(self, address, count, srv_info):
+            return DataHandler.Return(exp_code=EXP_ILLEGAL_FUNCTION)
+
+        read_d_inputs = read_coils
+
+        def write_coils(self, address, bits_l, srv_info):
+            return DataHandler.Return(exp_code=EXP_ILLEGAL_FUNCTION)
+
+        def write_h_regs(self, address, words_l, srv_info):
+            return DataHandler.Return(exp_code=EXP_ILLEGAL_FUNCTION)
+
+class FanoutServer:
+    """Read-only Modbus TCP server answering from the RegisterCache."""
+
+    def __init__(self, bind, port, cache):
+        self.cache = cache
+        self.server = ModbusServer(host=bind, port=port, no_block=True, data_hdl=CachedDataHandler(cache))
+
+    def start(self):
+        self.server.start()
+        logger.info("Modbus fan-out server listening on %s:%s (max age %ss)",
+                    self.server.host, self.server.port, self.cache.max_age)
+
+    def stop(self):
+        self.server.stop()
+
+# fresh: per-channel flags of the values read for this frame, None when all were
+Frame = collections.namedtuple('Frame', ['timestamp', 'registers', 'fresh'], defaults=(None,))
+
+class FrameBuffer:
+    """Bounded ring buffer of register frames; the oldest frames are dropped when full."""
+
+    def __init__(self, size):
+        self.frames = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def push(self, frame):
+        with self.lock:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+                metrics.inc('hpm_frames_dropped_total')
+            self.frames.append(frame)
+
+    def drain(self):
+        with self.lock:
+            frames = list(self.frames)
+            self.frames.clear()
+        return frames
+
+Aggregate = collections.namedtuple('Aggregate', ['means', 'mins', 'maxs', 'counts', 'frames', 'duration'])
+
+class SampleAggregator:
+    """Streaming per-channel mean/min/max over one publish interval."""
+
+    def __init__(self, channel_count):
+        self.channel_count = channel_count
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        n = self.channel_count
+        self.sums = array('d', [0.0]) * n
+        self.mins = array('d', [float('inf')]) * n
+        self.maxs = array('d', [float('-inf')]) * n
+        self.counts = array('L', [0]) * n
+        self.frames = 0
+        self.started = time.monotonic()
+
+    def add(self, frame):
+        with self.lock:
+            sums, mins, maxs, counts = self.sums, self.mins, self.maxs, self.counts
+            for i, value in enumerate(frame.registers):
+                if value is None:
+                    continue
+                sums[i] += value
+                counts[i] += 1
+                if value < mins[i]:
+                    mins[i] = value
+                if value > maxs[i]:
+                    maxs[i] = value
+            self.frames += 1
+
+    def snapshot(self):
+        with self.lock:
+            sums, mins, maxs, counts = self.sums, self.mins, self.maxs, self.counts
+            frames, duration = self.frames, time.monotonic() - self.started
+            self._reset()
+
+        means = [sums[i] / counts[i] if counts[i] else None for i in range(self.channel_count)]
+        mins = [mins[i] if counts[i] else None for i in range(self.channel_count)]
+        maxs = [maxs[i] if counts[i] else None for i in range(self.channel_count)]
+        return Aggregate(means, mins, maxs, counts, frames, duration)
+
+class LoadTracker:
+    """On/off state of one channel plus its CUSUM step detector."""
+
+    __slots__ = ('index', 'unit', 'name', 'on_threshold', 'off_threshold', 'min_duration', 'drift', 'limit',
+                 'state', 'pending_since', 'mean', 'samples', 'positive', 'negative', 'step', 'step_at')
+
+    def __init__(self, index, channel):
+        settings = channel['switch']
+        self.index = index
+        self.unit = channel['switch_unit']
+        self.name = channel['name']
+        self.on_threshold = settings['on']
+        self.off_threshold = settings['off']
+        self.min_duration = settings['min_duration']
+        # CUSUM tuned to steps of about the on threshold: a jump of 1.5x it alarms on the first sample
+        self.drift = settings['on'] / 2
+        self.limit = settings['on']
+        self.state = None
+        self.pending_since = None
+        self.mean = 0.0
+        self.samples = 0
+        self.positive = 0.0
+        self.negative = 0.0
+        self.step = 0
+        self.step_at = None
+
+class EventDetector:
+    """On/off detection with hysteresis and CUSUM step confirmation for switched channels."""
+
+    def __init__(self, channels, publisher):
+        self.trackers = [LoadTracker(i, channel) for i, channel in enumerate(channels) if channel['switch']]
+        self.publisher = publisher
+
+    def add(self, frame):
+        registers = frame.registers
+        for tracker in self.trackers:
+            value = registers[tracker.index]
+            if value is None:
+                continue
+            if self._update(tracker, value * CURRENT_MULTIPLIER, frame.timestamp):
+                self.publisher.publish(tracker.unit, tracker.state, frame.timestamp)
+
+    def _update(self, tracker, current, timestamp):
+        # CUSUM against the mean since the last detected step
+        if tracker.samples:
+            deviation = current - tracker.mean
+            tracker.positive = max(0.0, tracker.positive + deviation - tracker.drift)
+            tracker.negative = max(0.0, tracker.negative - deviation - tracker.drift)
+            if tracker.positive > tracker.limit or tracker.negative > tracker.limit:
+                tracker.step = 1 if tracker.positive > tracker.limit else -1
+                tracker.step_at = timestamp
+                tracker.samples = 0
+                tracker.positive = tracker.negative = 0.0
+                metrics.inc('hpm_load_steps_total')
+                logger.debug("Channel '%s': %s step to %.2fA", tracker.name, "up" if tracker.step > 0 else "down", current)
+        tracker.samples += 1
+        tracker.mean += (current - tracker.mean) / tracker.samples
+
+        if tracker.state is None:
+            tracker.state = current >= tracker.on_threshold
+            return True
+
+        wanted = current > tracker.off_threshold if tracker.state else current >= tracker.on_threshold
+        if wanted == tracker.state:
+            tracker.pending_since = None
+            return False
+        if tracker.pending_since is None:
+            tracker.pending_since = timestamp
+        # A step confirms the change only if it was seen since the change started (an older step says nothing
+        # about this crossing) and a later sample stayed on the new side (a single spike is not a step)
+        confirmed = tracker.step == (1 if wanted else -1) and tracker.pending_since <= tracker.step_at < timestamp
+        if timestamp - tracker.pending_since < tracker.min_duration and not confirmed:
+            return False
+
+        tracker.state = wanted
+        tracker.pending_since = None
+        tracker.step = 0
+        logger.debug("Channel '%s' switched %s at %.2fA", tracker.name, "on" if wanted else "off", current)
+        return True
+
+class EventPublisher:
+    """Delivers switch state changes to Domoticz from a background thread."""
+
+    def __init__(self, base_url, units):
+        self.api = DomoticzAPI(base_url)
+        self.idxs = {unit: Devices[unit].ID for unit in units if unit in Devices}
+        self.states = {}
+        self.delivered = {}
+        self.pending = collections.deque(maxlen=EVENT_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="HPM-Events", daemon=True)
+        self.thread.start()
+
+    def publish(self, unit, state, timestamp):
+        with self.lock:
+            self.states[unit] = (state, time.monotonic())
+            self.pending.append((unit, state, timestamp))
+        self.wakeup.set()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while self.pending:
+                with self.lock:
+                    unit, state, timestamp = self.pending.popleft()
+                self._deliver(unit, state, timestamp)
+
+    def _deliver(self, unit, state, timestamp):
+        idx = self.idxs.get(unit)
+        if idx is None:
+            return
+        params = {'type': 'command', 'param': 'udevice', 'idx': idx,
+                  'nvalue': 1 if state else 0, 'svalue': "On" if state else "Off"}
+        try:
+            data = self.api.get_json(params)
+            if data.get('status') != 'OK':
+                raise ValueError(f"status {data.get('status')}")
+        except Exception as e:
+            metrics.inc('hpm_event_errors_total')
+            logger.error("Switch event for IDX %s failed, applying it on the next heartbeat: %s", idx, e)
+            return
+        with self.lock:
+            self.delivered[unit] = state
+        metrics.inc('hpm_events_total')
+        metrics.observe('hpm_event_delay_seconds', time.time() - timestamp)
+
+    def sync_devices(self):
+        """Apply undelivered states directly; plugin thread only."""
+        settled = time.monotonic() - 2 * HTTP_TIMEOUT  # leave changes still in flight to the publisher
+        with self.lock:
+            missed = [(unit, state) for unit, (state, changed_at) in self.states.items()
+                      if self.delivered.get(unit) != state and changed_at < settled]
+            for unit, state in missed:
+                self.delivered[unit] = state
+        for unit, state in missed:
+            if unit in Devices:
+                Devices[unit].Update(nValue=1 if state else 0, sValue="On" if state else "Off")
+
+    def stop(self, timeout=HTTP_TIMEOUT):
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+        self.api.close()
+
+class AdaptiveScheduler:
+    """Adapts the poll interval to how fast the channel currents are changing."""
+
+    def __init__(self, interval, min_interval, max_interval, change_threshold):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.threshold = change_threshold / CURRENT_MULTIPLIER
+        self.previous = None
+        metrics.set('hpm_poll_interval_seconds', self.interval)
+
+    def observe(self, registers):
+        if registers is None:
+            return self.interval
+
+        previous, self.previous = self.previous, registers
+        if previous is not None:
+            change = max((abs(new - old) for new, old in zip(registers, previous)
+                          if new is not None and old is not None), default=0)
+            if change >= self.threshold:
+                self.interval = max(self.min_interval, self.interval / 2)
+            else:
+                self.interval = min(self.max_interval, self.interval * 1.25)
+            metrics.set('hpm_poll_interval_seconds', self.interval)
+        return self.interval
+
+class AcquisitionWorker:
+    """Polls the module on its own schedule, independent of the Domoticz heartbeat."""
+
+    def __init__(self, module_poller, interval, sample_handlers, scheduler=None, initial_delay=0):
+        self.module_poller = module_poller
+        self.sample_handlers = sample_handlers
+        self.interval = interval
+        self.scheduler = scheduler
+        self.initial_delay = initial_delay
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="HPM-Acquisition", daemon=True)
+        self.thread.start()
+        logger.info("Acquisition thread started, polling every %ss", self.interval)
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                logger.warning("Acquisition thread did not stop in time")
+        self.thread = None
+
+    def _run(self):
+        if self.initial_delay and self.stop_event.wait(self.initial_delay):
+            return
+        next_poll = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                registers = self.module_poller.read_all()
+                if registers is not None:
+                    frame = Frame(time.time(), registers, self.module_poller.fresh)
+                    for handler in self.sample_handlers:
+                        handler(frame)
+                if self.scheduler:
+                    self.interval = self.scheduler.observe(registers)
+            except Exception as e:
+                logger.error("Acquisition error: %s", e)
+
+            now = time.monotonic()
+            next_poll = max(next_poll + self.interval, now)
+            self.stop_event.wait(next_poll - now)
+
 class HPMPlugin:
     def __init__(self):
         self.connection_params = {}
+        self.modules = []
         self.channels = []
+        self.options = {}
+        self.domoticz_api = None
+        self.value_cache = None
+        self.mqtt_subscriber = None
         self.device_manager = None
-        self.modbus_manager = None
+        self.module_poller = None
+        self.frame_buffer = None
+        self.sample_aggregator = None
+        self.acquisition_worker = None
+        self.energy = None
+        self.metrics_server = None
+        self.fanout_server = None
+        self.event_detector = None
+        self.event_publisher = None
+        self.history = None
+        self.capture = None
+        self.scheduler = None
+        self.state_store = None
+        self.last_registers = None
+        self.last_registers_at = 0
         self.run_interval = 1
 
     def on_start(self):
@@ -503,8 +3577,9 @@ class HPMPlugin:
             logger.set_debug_mode(debug_enabled)
             Domoticz.Debugging(1 if debug_enabled else 0)
 
-            self.connection_params, self.channels = ConfigValidator.validate_config(Parameters)
-            logger.info(f"Loaded configuration for {len(self.channels)} channels")
+            self.connection_params, self.modules, self.channels, self.options = ConfigValidator.validate_config(Parameters)
+            logger.info("Loaded configuration for %d channels on %d module(s)", len(self.channels), len(self.modules))
+            ConfigValidator.check_legacy_summaries(self.modules, self.channels, Devices)
 
             if logger.debug_mode:
                 for i, channel in enumerate(self.channels):
@@ -519,47 +3594,346 @@ class HPMPlugin:
                         config_info += f", PF {channel['pf']}"
                     logger.debug(config_info)
 
-            self.device_manager = DeviceManager(self.channels)
+            warm_state = None
+            if self.options['warm_start']:
+                state_file = self.options['state_file'] or os.path.join(
+                    Parameters.get("HomeFolder", ""), f"hpm_state_{Parameters.get('HardwareID', 0)}.json"
+                )
+                self.state_store = StateStore(state_file, StateStore.fingerprint_of(self.modules, self.channels))
+                warm_state = self.state_store.load()
+
+            self.domoticz_api = DomoticzAPI(self.options['domoticz_url'])
+            fetch_plan = FetchPlan(self.channels)
+            shared = None
+            if self.options['shared_cache_file'] and fetch_plan.idxs:
+                shared = SharedValueTable(self.options['shared_cache_file'])
+                logger.info("Sharing voltage/PF values with other instances through %s",
+                            self.options['shared_cache_file'])
+            value_fetcher = ValueFetcher(
+                self.domoticz_api, self.options['value_fetch'], self.options['fetch_workers'],
+                self.options['fetch_deadline'], CircuitBreaker("Domoticz API", cooloff=self.options['breaker_cooloff'])
+            )
+            self.value_cache = ValueCache(
+                value_fetcher, fetch_plan.idxs,
+                ttl=self.options['value_ttl'],
+                max_age=self.options['value_max_age'],
+                ttl_per_idx=self.options['value_ttl_per_idx'],
+                shared=shared
+            )
+            if fetch_plan.idxs:
+                restored = self.value_cache.restore(
+                    {int(idx): tuple(value) for idx, value in warm_state['values'].items()}
+                ) if warm_state else 0
+                if restored < len(fetch_plan.idxs):
+                    logger.info("Resolving %d dynamic voltage/PF devices from %s",
+                                len(fetch_plan.idxs) - restored, self.options['domoticz_url'])
+                    self.value_cache.refresh()
+                if self.options['mqtt_host']:
+                    self.mqtt_subscriber = MQTTSubscriber(
+                        self.options['mqtt_host'], self.options['mqtt_port'], self.options['mqtt_topic'],
+                        self.value_cache, fetch_plan.idxs,
+                        client_id=f"hpm-{Parameters.get('HardwareID', 0)}-{os.getpid()}",
+                        username=self.options['mqtt_username'], password=self.options['mqtt_password']
+                    )
+                    self.mqtt_subscriber.start()
+
+            summary_unit_start = ConfigValidator.summary_unit_start(self.modules)
+            poll_interval = self.options['poll_interval'] or self.connection_params['interval'] * HEARTBEAT_SECONDS
+            longest_interval = poll_interval
+            if self.options['adaptive_polling']:
+                longest_interval = self.options['poll_max_interval'] or poll_interval * 6
+            if self.options['energy']:
+                energy_file = self.options['energy_file'] or os.path.join(
+                    Parameters.get("HomeFolder", ""), f"hpm_energy_{Parameters.get('HardwareID', 0)}.dat"
+                )
+                # A gap only counts as an outage once it is clearly longer than the slowest polling
+                self.energy = EnergyAccumulator(EnergyStore(energy_file), self.channels,
+                                                max(ENERGY_MAX_GAP, longest_interval * 3))
+                logger.info("Restored energy counters from %s: total %.3fkWh",
+                            energy_file, self.energy.total_wh() / 1000)
+
+            publish_filter = PublishFilter(self.options['deadband'], self.options['publish_refresh'])
+            if self.options['compute_engine'] == 'auto':
+                use_numpy = numpy is not None and len(self.channels) >= NUMPY_MIN_CHANNELS
+            else:
+                use_numpy = self.options['compute_engine'] == 'numpy' and numpy is not None
+            if self.options['compute_engine'] == 'numpy' and numpy is None:
+                logger.warning("NumPy not available, using the pure Python compute engine")
+            self.device_manager = DeviceManager(self.channels, self.value_cache, summary_unit_start, publish_filter,
+                                                self.energy, use_numpy, self.options['groups'])
+            if self.options['diagnostic_devices']:
+                self.device_manager.create_diagnostic_devices()
+            if warm_state:
+                self._restore_devices(warm_state)
+
+            switch_units = [channel['switch_unit'] for channel in self.channels if channel['switch']]
+            if switch_units:
+                self.event_publisher = EventPublisher(self.options['domoticz_url'], switch_units)
+                self.event_publisher.start()
+                self.event_detector = EventDetector(self.channels, self.event_publisher)
+                logger.info("On/off detection for %d channel(s)", len(switch_units))
+
+            if self.options['history_file']:
+                self.history = HistoryStore(
+                    self.options['history_file'], self.channels,
+                    self.options['history_batch'], self.options['history_retention_days']
+                )
+                self.history.start()
+            if self.options['capture_file']:
+                self.capture = CaptureWriter(self.options['capture_file'], self.channels, fetch_plan.idxs,
+                                             summary_unit_start, self.options['capture_max_mb'] * 1024 * 1024)
             if self.device_manager.sorted_phases:
                 phase_info = ', '.join([f"{self.device_manager.phase_labels[idx]} (IDX {idx})" for idx in self.device_manager.sorted_phases])
-                logger.info(f"Detected {len(self.device_manager.sorted_phases)} phases: {phase_info}")
-
-            self.modbus_manager = ModbusManager(self.connection_params)
+                logger.info("Detected %d phases: %s", len(self.device_manager.sorted_phases), phase_info)
+
+            if self.options['adaptive_polling']:
+                self.scheduler = AdaptiveScheduler(
+                    poll_interval,
+                    self.options['poll_min_interval'] or poll_interval,
+                    longest_interval,
+                    self.options['change_threshold']
+                )
+                logger.info("Adaptive polling between %ss and %ss",
+                            self.scheduler.min_interval, self.scheduler.max_interval)
+                if warm_state and warm_state.get('poll_interval'):
+                    self.scheduler.interval = min(max(warm_state['poll_interval'], self.scheduler.min_interval),
+                                                  self.scheduler.max_interval)
+                    metrics.set('hpm_poll_interval_seconds', self.scheduler.interval)
+
+            register_cache = None
+            if self.options['fanout_port']:
+                if ModbusServer is None:
+                    raise Exception("pyModbusTCP library not available for the fan-out server")
+                register_cache = RegisterCache(self.options['fanout_max_age'] or longest_interval * 3)
+                self.fanout_server = FanoutServer(self.options['fanout_bind'], self.options['fanout_port'],
+                                                  register_cache)
+
+            self.module_poller = ModulePoller(
+                self.modules, self.connection_params,
+                session=self.options['modbus_session'],
+                strategy=self.options['module_polling'],
+                bus_budget=self.options['bus_budget'],
+                backoff_base=self.options['backoff_base'],
+                backoff_max=self.options['backoff_max'],
+                registers=self.options['registers'],
+                register_gap=self.options['register_gap'],
+                on_registers=self._apply_registers,
+                register_cache=register_cache
+            )
 
-            if not self.modbus_manager.connect():
+            if not self.module_poller.connect():
                 raise Exception("Modbus connection failed")
 
+            # Devices already show the snapshot, so instances restarted together need not all poll at once
+            first_poll_delay = 0
+            if warm_state:
+                self.module_poller.restore_health(warm_state.get('health') or {})
+                if self.options['acquisition'] == 'thread':
+                    first_poll_delay = random.uniform(0, poll_interval)
+                else:
+                    self.run_interval = random.randint(1, self.connection_params['interval'] + 1)
+                    first_poll_delay = (self.run_interval - 1) * HEARTBEAT_SECONDS
+                logger.info("Warm start: first poll in %.1fs", first_poll_delay)
+
+            if self.options['acquisition'] == 'thread':
+                if self.options['sample_aggregation']:
+                    self.sample_aggregator = SampleAggregator(len(self.channels))
+                    sample_handlers = [self.sample_aggregator.add]
+                else:
+                    self.frame_buffer = FrameBuffer(self.options['buffer_size'])
+                    sample_handlers = [self.frame_buffer.push]
+                if self.energy or self.history:
+                    sample_handlers.append(self._process_sample)
+                if self.event_detector:
+                    sample_handlers.append(self.event_detector.add)
+                if self.capture:
+                    sample_handlers.append(self._capture_sample)
+                self.acquisition_worker = AcquisitionWorker(self.module_poller, poll_interval, sample_handlers,
+                                                            self.scheduler, first_poll_delay)
+                self.acquisition_worker.start()
+
+            if self.options['metrics_port']:
+                self.metrics_server = MetricsServer(self.options['metrics_bind'], self.options['metrics_port'])
+                self.metrics_server.start()
+            if self.fanout_server:
+                self.fanout_server.start()
+
             logger.info("HPM plugin started successfully")
 
         except ValidationError as e:
-            logger.error(f"Configuration error: {e}")
+            logger.error("Configuration error: %s", e)
         except Exception as e:
-            logger.error(f"Startup failed: {e}")
+            logger.error("Startup failed: %s", e)
 
     def on_heartbeat(self):
+        logger.flush()
+        if self.event_publisher:
+            self.event_publisher.sync_devices()
+        if self.state_store and time.monotonic() - self.state_store.last_save >= STATE_SAVE_INTERVAL:
+            self._save_state()
         self.run_interval -= 1
         if self.run_interval > 0:
             return
 
         self.run_interval = self.connection_params['interval']
+        heartbeat_started = time.monotonic()
 
         try:
-            if not self.modbus_manager.check_connection():
-                return
+            with metrics.timer('hpm_stage_seconds', stage='acquire'):
+                if self.sample_aggregator:
+                    current_values = self._aggregated_values()
+                elif self.acquisition_worker:
+                    current_values = self._latest_acquired_values()
+                else:
+                    current_values = self._read_inline()
+
+            if current_values is not None:
+                self.device_manager.update_devices(current_values)
+                self.last_registers = current_values
+                self.last_registers_at = time.time()
 
-            current_values = self.modbus_manager.read_channels()
-            if current_values is None:
-                return
+        except Exception as e:
+            metrics.inc('hpm_heartbeat_errors_total')
+            logger.error("Heartbeat error: %s", e)
+
+        finally:
+            self._record_heartbeat(time.monotonic() - heartbeat_started)
+
+    def _record_heartbeat(self, duration):
+        metrics.observe('hpm_heartbeat_seconds', duration)
+        if self.frame_buffer:
+            metrics.set('hpm_frame_buffer_dropped', self.frame_buffer.dropped)
+
+        if duration > self.options['heartbeat_budget']:
+            metrics.inc('hpm_heartbeat_overruns_total')
+            stages = ', '.join(f"{stage} {metrics.quantile('hpm_stage_seconds', 1.0, stage=stage) * 1000:.0f}ms"
+                               for stage in ('acquire', 'compute', 'publish'))
+            logger.warning("Heartbeat took %.0fms, over the %ss budget (slowest recent stages: %s)",
+                           duration * 1000, self.options['heartbeat_budget'], stages)
+
+        if self.options['diagnostic_devices'] and self.device_manager:
+            self.device_manager.update_diagnostic_devices(duration)
+
+    def _read_inline(self):
+        registers = self.module_poller.read_all()
+        if registers is not None and (self.energy or self.history or self.event_detector or self.capture):
+            frame = Frame(time.time(), registers, self.module_poller.fresh)
+            if self.capture:
+                self._capture_sample(frame)
+            if self.event_detector:
+                self.event_detector.add(frame)
+            if self.energy or self.history:
+                self._process_sample(frame)
+        if self.scheduler:
+            # Inline polling can only follow the scheduler in whole heartbeats
+            self.run_interval = max(1, round(self.scheduler.observe(registers) / HEARTBEAT_SECONDS))
+        return registers
+
+    def _apply_registers(self, values):
+        for register in self.options['registers']:
+            value = values.get(register['name'])
+            if value is None:
+                continue
+            metrics.set('hpm_register_value', value, register=register['name'])
+            # Registers read from the bus replace HTTP for the Domoticz device they mirror
+            if register['idx'] is not None:
+                self.value_cache.push(register['idx'], value)
+        if logger.debug_mode:
+            logger.debug("Register values: %s", values)
+
+    def _process_sample(self, frame):
+        result = self.device_manager.compute_sample(frame.registers)
+        if self.energy:
+            powers = [watts if valid else None for watts, valid in zip(result.powers, result.power_valid)]
+            self.energy.add_sample(frame.timestamp, powers, frame.fresh)
+        if self.history:
+            self.history.add(frame.timestamp, result, frame.fresh)
+
+    def _restore_devices(self, state):
+        registers = state.get('registers') or {}
+        age = time.time() - registers.get('at', 0)
+        if registers.get('values') and len(registers['values']) == len(self.channels) and age <= STATE_MAX_AGE:
+            self.last_registers, self.last_registers_at = registers['values'], registers['at']
+            self.device_manager.update_devices(self.last_registers)
+            logger.info("Warm start: devices restored from readings taken %.0fs ago", age)
+
+    def _save_state(self):
+        self.state_store.save({
+            'registers': {'at': self.last_registers_at, 'values': self.last_registers} if self.last_registers else None,
+            'values': {str(idx): list(value) for idx, value in self.value_cache.snapshot().items()}
+                      if self.value_cache else {},
+            'poll_interval': self.scheduler.interval if self.scheduler else None,
+            'health': self.module_poller.health_state() if self.module_poller else {}
+        })
+
+    def _capture_sample(self, frame):
+        self.capture.add(frame, self.value_cache.get_values())
+
+    def _latest_acquired_values(self):
+        frames = self.frame_buffer.drain()
+        if not frames:
+            logger.debug("No new frames from acquisition thread")
+            return None
 
-            self.device_manager.update_devices(current_values)
+        latest = frames[-1]
+        if logger.debug_mode:
+            logger.debug("Drained %d frame(s), publishing frame from %.1fs ago (%d dropped so far)",
+                         len(frames), time.time() - latest.timestamp, self.frame_buffer.dropped)
+        return latest.registers
 
-        except Exception as e:
-            logger.error(f"Heartbeat error: {e}")
+    def _aggregated_values(self):
+        aggregate = self.sample_aggregator.snapshot()
+        if not aggregate.frames:
+            logger.debug("No samples from acquisition thread")
+            return None
+
+        if logger.debug_mode:
+            logger.debug("Aggregated %d samples over %.1fs (%.1f/s)",
+                         aggregate.frames, aggregate.duration, aggregate.frames / max(aggregate.duration, 0.001))
+            for i, channel in enumerate(self.channels):
+                if aggregate.counts[i]:
+                    logger.debug("Channel '%s': min %.2fA, mean %.2fA, max %.2fA", channel['name'],
+                                 aggregate.mins[i] * CURRENT_MULTIPLIER, aggregate.means[i] * CURRENT_MULTIPLIER,
+                                 aggregate.maxs[i] * CURRENT_MULTIPLIER)
+
+        return {
+            'mean': aggregate.means,
+            'min': aggregate.mins,
+            'max': aggregate.maxs
+        }[self.options['sample_aggregation']]
 
     def on_stop(self):
         logger.info("Stopping HPM plugin")
-        if self.modbus_manager:
-            self.modbus_manager.disconnect()
+        if self.device_manager:
+            logger.info("Device updates: %s", self.device_manager.publish_filter.summary())
+        if self.acquisition_worker:
+            self.acquisition_worker.stop()
+        if self.state_store:
+            self._save_state()
+        if self.module_poller:
+            logger.info("Modbus read latency: %s", self.module_poller.latency_summary())
+            self.module_poller.disconnect()
+        if self.energy:
+            self.energy.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.fanout_server:
+            self.fanout_server.stop()
+        if self.history:
+            self.history.stop()
+        if self.capture:
+            self.capture.close()
+        if self.event_publisher:
+            self.event_publisher.stop()
+        if self.mqtt_subscriber:
+            logger.info("MQTT value updates received: %s", self.mqtt_subscriber.messages)
+            self.mqtt_subscriber.stop()
+        if self.value_cache:
+            self.value_cache.stop()
+        if self.domoticz_api:
+            self.domoticz_api.close()
+        logger.flush_suppressed()
+        logger.flush()
         logger.info("HPM plugin stopped")
 
 # Global plugin instance
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HomePowerMonitor capture replay
+
+Feeds a capture recorded with the capture_file option through the plugin's
+DeviceManager computation as fast as possible, outside Domoticz and without
+hardware, using the channel configuration stored in the capture. Use it to
+reproduce field issues and to profile the pipeline on real data.
+
+Usage:
+    python3 replay.py hpm_capture.bin
+    python3 replay.py hpm_capture.bin --compute-only --engine numpy
+    python3 replay.py hpm_capture.bin --profile --limit 100000
+"""
+
+import sys
+import json
+import time
+import pstats
+import argparse
+import cProfile
+
+import fakeDomoticz
+
+class CapturedValues:
+    """Stands in for the plugin's ValueCache, serving the voltage/PF values of the current record."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get_values(self):
+        return self.values
+
+def run(args):
+    fakeDomoticz.VERBOSE = args.debug
+    import plugin
+    plugin.Devices = fakeDomoticz.Devices
+    fakeDomoticz.Devices.clear()
+    plugin.logger.set_debug_mode(args.debug)
+
+    reader = plugin.CaptureReader(args.capture)
+    channels = [dict(channel) for channel in reader.channels]
+    if len(reader) == 0:
+        raise SystemExit(f"{args.capture} contains no frames")
+
+    values = CapturedValues()
+    use_numpy = args.engine == 'numpy'
+    if use_numpy and plugin.numpy is None:
+        raise SystemExit("NumPy is not installed")
+    device_manager = plugin.DeviceManager(channels, values, reader.summary_unit_start, use_numpy=use_numpy)
+
+    profiler = cProfile.Profile() if args.profile else None
+    frames = 0
+    first = last = None
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    records = iter(reader)
+    for timestamp, registers, values.values in records:
+        if args.compute_only:
+            device_manager.compute_sample(registers)
+        else:
+            device_manager.update_devices(registers)
+        if first is None:
+            first = timestamp
+        last = timestamp
+        frames += 1
+        if frames == args.limit:
+            break
+    if profiler:
+        profiler.disable()
+    elapsed = time.perf_counter() - started
+    records.close()
+    reader.close()
+
+    if profiler:
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(args.profile)
+
+    return {
+        'frames': frames,
+        'channels': len(channels),
+        'captured_seconds': last - first,
+        'replay_seconds': elapsed,
+        'frames_per_s': frames / elapsed if elapsed else 0.0,
+        'speedup': (last - first) / elapsed if elapsed else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an HPM capture file through the plugin computation")
+    parser.add_argument('capture', help="capture file written with the capture_file option")
+    parser.add_argument('--limit', type=int, default=0, help="replay at most this many frames")
+    parser.add_argument('--compute-only', action='store_true',
+                        help="only compute currents/powers, skip device publishing")
+    parser.add_argument('--engine', choices=('python', 'numpy'), default='python', help="compute engine")
+    parser.add_argument('--profile', type=int, nargs='?', const=25, default=0,
+                        help="profile the replay and print the N most expensive calls (default 25)")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    parser.add_argument('--debug', action='store_true', help="show plugin log output")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{results['frames']} frames, {results['channels']} channels, "
+              f"{results['captured_seconds']:.0f}s captured")
+        print(f"  replayed in {results['replay_seconds']:.3f}s: {results['frames_per_s']:.0f} frames/s, "
+              f"{results['speedup']:.0f}x real time")
+
+if __name__ == '__main__':
+    main()
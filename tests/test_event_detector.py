@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+import plugin
+
+
+class Publisher:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, unit, state, timestamp):
+        self.events.append((timestamp, state))
+
+
+def run(series, on=0.5, off=0.2, min_duration=3):
+    channel = {'name': 'A', 'switch': {'on': on, 'off': off, 'min_duration': min_duration}, 'switch_unit': 200}
+    publisher = Publisher()
+    detector = plugin.EventDetector([channel], publisher)
+    for t, amperes in enumerate(series):
+        register = None if amperes is None else int(round(amperes / plugin.CURRENT_MULTIPLIER))
+        detector.add(plugin.Frame(float(t), [register]))
+    return publisher.events
+
+
+def test_first_sample_sets_the_initial_state():
+    assert run([0.0]) == [(0.0, False)]
+    assert run([2.0]) == [(0.0, True)]
+
+
+def test_clean_step_is_confirmed_on_the_next_sample():
+    assert run([0] * 5 + [5] * 5 + [0] * 5) == [(0.0, False), (6.0, True), (11.0, False)]
+
+
+def test_slow_ramp_waits_for_min_duration():
+    assert run([0, 0.1, 0.3, 0.55, 0.6, 0.6, 0.6, 0.6, 0.6]) == [(0.0, False), (6.0, True)]
+
+
+def test_single_spike_does_not_switch():
+    assert run([0] * 5 + [5] + [0] * 5) == [(0.0, False)]
+
+
+def test_noise_around_the_on_threshold_does_not_switch():
+    assert run([0.1, 0.6, 0.1, 0.6, 0.1, 0.6, 0.1, 0.1, 0.1]) == [(0.0, False)]
+
+
+def test_dip_above_the_off_threshold_keeps_the_load_on():
+    assert run([2] * 3 + [0.3] * 4 + [2] * 2) == [(0.0, True)]
+
+
+def test_old_step_does_not_confirm_a_later_crossing():
+    # The down step from 5A to 3A is long past when the current briefly drops below the off threshold
+    assert run([5] * 10 + [3] * 600 + [0.1] + [3] * 5) == [(0.0, True)]
+
+
+def test_missing_readings_are_skipped():
+    assert run([0, None, None, 0, 0]) == [(0.0, False)]
+
+
+def parse_switches(channel_switches, slot=0):
+    channels = [{"name": f"C{i}", "voltage_idx": 1297, "pf": 1, "switch": channel_switches.get(i, False)}
+                for i in range(16)]
+    modules = {"modules": [{"unit_id": 1, "slot": slot, "channels": channels}]}
+    params = {"Address": "10.0.0.1", "Port": "502", "Mode2": "1", "Mode3": "1", "Mode6": "Normal",
+              "Mode1": json.dumps(modules), "Mode4": ""}
+    _, _, parsed, _ = plugin.ConfigValidator.validate_config(params)
+    return {i: channel['switch_unit'] for i, channel in enumerate(parsed) if channel['switch']}
+
+
+def test_switch_units_follow_slot_and_channel_position():
+    assert parse_switches({5: True}) == {5: 205}
+    assert parse_switches({0: True, 5: True}) == {0: 200, 5: 205}
+    assert parse_switches({5: True}, slot=1) == {5: 221}
+    assert parse_switches({5: {"unit": 150}}) == {5: 150}
+
+
+def test_switch_unit_collisions_are_rejected():
+    with pytest.raises(plugin.ValidationError):
+        parse_switches({5: {"unit": 6}})
+    with pytest.raises(plugin.ValidationError):
+        parse_switches({3: {"unit": 210}, 10: True})
@@ -0,0 +1,101 @@
+import json
+
+import plugin
+
+
+def field(address, width=1, unit_id=1, function='holding', gateway=('10.0.0.1', 502), name=None):
+    return {'gateway': gateway, 'unit_id': unit_id, 'function': function, 'address': address, 'width': width,
+            'name': name or f"r{address}"}
+
+
+def spans(blocks):
+    return sorted((block.unit_id, block.function, block.address, block.count) for block in blocks)
+
+
+def test_fields_within_gap_share_one_request():
+    blocks = plugin.ReadPlanner.plan([field(8, 16), field(30, 2), field(24)], max_gap=8)
+    assert spans(blocks) == [(1, 'holding', 8, 24)]
+    assert [(f['address'], offset) for f, offset in blocks[0].fields] == [(8, 0), (24, 16), (30, 22)]
+
+
+def test_gap_larger_than_max_gap_splits():
+    blocks = plugin.ReadPlanner.plan([field(8, 16), field(33, 2)], max_gap=8)
+    assert spans(blocks) == [(1, 'holding', 8, 16), (1, 'holding', 33, 2)]
+
+
+def test_request_stays_within_pdu_limit():
+    fields = [field(address, 2) for address in range(0, 200, 2)]
+    blocks = plugin.ReadPlanner.plan(fields, max_gap=8)
+    assert all(block.count <= plugin.MODBUS_MAX_REGISTERS for block in blocks)
+    assert sum(len(block.fields) for block in blocks) == len(fields)
+
+
+def test_units_functions_and_gateways_are_not_merged():
+    blocks = plugin.ReadPlanner.plan([field(8), field(9, unit_id=2), field(10, function='input'),
+                                      field(11, gateway=('10.0.0.2', 502))])
+    assert len(blocks) == 4
+
+
+def test_negative_gap_reads_every_field_separately():
+    blocks = plugin.ReadPlanner.plan([field(8, 16), field(24), field(25, 2)], max_gap=-1)
+    assert spans(blocks) == [(1, 'holding', 8, 16), (1, 'holding', 24, 1), (1, 'holding', 25, 2)]
+
+
+def test_decode_types_and_word_order():
+    decode = plugin.ReadPlanner.decode
+    base = {'scale': 1, 'word_order': 'big'}
+    assert decode([0xFFFE], 0, dict(base, type='s16')) == -2
+    assert decode([0x0001, 0x0002], 0, dict(base, type='u32')) == 0x00010002
+    assert decode([0x0002, 0x0001], 0, dict(base, type='u32', word_order='little')) == 0x00010002
+    assert decode([0xFFFF, 0xFFFF], 0, dict(base, type='s32')) == -1
+    assert decode([0x4148, 0x0000], 0, dict(base, type='f32', scale=0.5)) == 6.25
+
+
+class FakeClient:
+    """Modbus client answering every read except the ranges listed in refuse."""
+
+    def __init__(self, refuse=()):
+        self.unit_id = None
+        self.refuse = set(refuse)
+        self.requests = []
+        self.last_except = 0
+        self.last_error = 0
+
+    def read_holding_registers(self, address, count):
+        self.requests.append((self.unit_id, address, count))
+        if (self.unit_id, address, count) in self.refuse:
+            self.last_except = plugin.EXP_DATA_ADDRESS
+            return None
+        self.last_except = 0
+        return [address + i for i in range(count)]
+
+
+def make_poller(unit_registers):
+    channels = [{"name": f"C{i}", "voltage": 230, "pf": 1} for i in range(16)]
+    modules = {"modules": [{"unit_id": unit_id, "channels": channels} for unit_id in sorted(unit_registers)]}
+    registers = [{"name": f"R{unit_id}", "unit_id": unit_id, "address": 30}
+                 for unit_id, wanted in unit_registers.items() if wanted]
+    params = {"Address": "10.0.0.1", "Port": "502", "Mode2": "1", "Mode3": "1", "Mode6": "Normal",
+              "Mode1": json.dumps(modules), "Mode4": json.dumps({"registers": registers})}
+    connection_params, modules, _, options = plugin.ConfigValidator.validate_config(params)
+    poller = plugin.ModulePoller(modules, connection_params, registers=options['registers'])
+    manager = poller.gateways[('10.0.0.1', 502)]
+    return poller, manager
+
+
+def test_refused_coalesced_read_is_split_and_retried():
+    poller, manager = make_poller({1: True})
+    manager.client = FakeClient(refuse={(1, 8, 23)})
+    values = poller.read_all()
+    assert values[:2] == [8, 9]
+    assert manager.client.requests == [(1, 8, 23), (1, 8, 16), (1, 30, 1)]
+    assert spans(poller.devices[0]) == [(1, 'holding', 8, 16), (1, 'holding', 30, 1)]
+
+
+def test_refusal_of_one_unit_does_not_split_another_that_is_backing_off():
+    poller, manager = make_poller({1: False, 2: True})
+    manager.client = FakeClient(refuse={(1, 8, 16)})
+    manager.backoff[2] = plugin.RetryBackoff(manager.backoff_base, manager.backoff_max)
+    manager.backoff[2].failure()
+    poller.read_all()
+    assert [len(device) for device in poller.devices] == [1, 1]
@@ -0,0 +1,96 @@
+import os
+import struct
+import threading
+
+import pytest
+
+import plugin
+
+pytestmark = pytest.mark.skipif(plugin.termios is None, reason="serial ports need termios")
+
+
+def frame(payload):
+    return payload + struct.pack('<H', plugin.ModbusRTUClient.crc16(payload))
+
+
+def registers_response(unit_id, words, function_code=3):
+    return frame(struct.pack(f'>BBB{len(words)}H', unit_id, function_code, len(words) * 2, *words))
+
+
+class Slave:
+    """Answers each request on the master side of a pty with the next scripted response."""
+
+    def __init__(self, responses):
+        self.master, slave = os.openpty()
+        self.path = os.ttyname(slave)
+        self.slave = slave
+        self.responses = list(responses)
+        self.requests = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for response in self.responses:
+            request = b''
+            while len(request) < 8:
+                request += os.read(self.master, 8 - len(request))
+            self.requests.append(request)
+            for chunk in response:
+                os.write(self.master, chunk)
+
+    def close(self):
+        self.thread.join(2)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def client_for(slave, unit_id=7):
+    return plugin.ModbusRTUClient(slave.path, baudrate=115200, unit_id=unit_id, timeout=0.3)
+
+
+def test_crc16_matches_the_modbus_reference():
+    assert plugin.ModbusRTUClient.crc16(bytes.fromhex('01030000000A')) == 0xCDC5
+    assert frame(bytes.fromhex('01030000000A'))[-2:] == bytes.fromhex('C5CD')
+
+
+def test_reads_registers_and_sends_a_valid_request():
+    slave = Slave([[registers_response(7, [1, 0xFFFF, 300])]])
+    client = client_for(slave)
+    assert client.read_holding_registers(8, 3) == [1, 0xFFFF, 300]
+    client.close()
+    slave.close()
+    assert slave.requests == [frame(struct.pack('>BBHH', 7, 3, 8, 3))]
+
+
+def test_response_split_across_reads_is_reassembled():
+    response = registers_response(7, [10, 20], function_code=4)
+    slave = Slave([[response[:2], response[2:5], response[5:]]])
+    client = client_for(slave)
+    assert client.read_input_registers(0, 2) == [10, 20]
+    client.close()
+    slave.close()
+
+
+def test_exception_response_sets_last_except():
+    slave = Slave([[frame(bytes([7, 0x83, plugin.EXP_DATA_ADDRESS]))]])
+    client = client_for(slave)
+    assert client.read_holding_registers(8, 16) is None
+    assert client.last_except == plugin.EXP_DATA_ADDRESS
+    client.close()
+    slave.close()
+
+
+@pytest.mark.parametrize('response, error', [
+    (registers_response(7, [1, 2])[:-1] + b'\x00', "CRC mismatch"),
+    (registers_response(8, [1, 2]), "unexpected response header"),
+    (registers_response(7, [1]), "unexpected byte count"),
+    (registers_response(7, [1, 2])[:5], "timeout"),
+])
+def test_broken_responses_fail_and_the_next_read_starts_clean(response, error):
+    slave = Slave([[response], [registers_response(7, [5, 6])]])
+    client = client_for(slave)
+    assert client.read_holding_registers(8, 2) is None
+    assert error in client.last_error_as_txt
+    assert client.read_holding_registers(8, 2) == [5, 6]
+    client.close()
+    slave.close()